@@ -0,0 +1,211 @@
+import os
+import math
+import logging
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FLAT = "flat"
+HNSW = "hnsw"
+IVF_FLAT = "ivf_flat"
+IVF_SQ = "ivf_sq"
+IVF_PQ = "ivf_pq"
+AUTO = "auto"
+INDEX_MODES = (FLAT, HNSW, IVF_FLAT, IVF_SQ, IVF_PQ)
+
+# k-means wants at least this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+RECONSTRUCT_BLOCK = 65536
+
+
+@dataclass(frozen=True)
+class IndexSettings:
+    """Which FAISS index type to build, and its build/search parameters."""
+    mode: str = AUTO
+    # Auto policy: exact search below ivf_min, then IVF-Flat, 8-bit scalar
+    # quantization from sq_min and product quantization from pq_min vectors.
+    # HNSW is never picked automatically: it cannot remove vectors, so every
+    # document delete rebuilds its graph.
+    ivf_min: int = 50_000
+    sq_min: int = 200_000
+    pq_min: int = 1_000_000
+    nlist: int = 0  # 0 = about 4 * sqrt(vectors)
+    nprobe: int = 16
+    pq_m: int = 0  # 0 = one sub-quantizer per 16 dimensions
+    hnsw_m: int = 32
+    ef_construction: int = 80
+    ef_search: int = 64
+
+    @classmethod
+    def from_env(cls) -> "IndexSettings":
+        mode = os.getenv("INDEX_MODE", cls.mode)
+        if mode not in INDEX_MODES + (AUTO,):
+            raise ValueError(f"INDEX_MODE must be one of {list(INDEX_MODES + (AUTO,))}")
+        return cls(
+            mode=mode,
+            ivf_min=int(os.getenv("INDEX_IVF_MIN_VECTORS", cls.ivf_min)),
+            sq_min=int(os.getenv("INDEX_SQ_MIN_VECTORS", cls.sq_min)),
+            pq_min=int(os.getenv("INDEX_PQ_MIN_VECTORS", cls.pq_min)),
+            nlist=int(os.getenv("INDEX_NLIST", cls.nlist)),
+            nprobe=int(os.getenv("INDEX_NPROBE", cls.nprobe)),
+            pq_m=int(os.getenv("INDEX_PQ_M", cls.pq_m)),
+            hnsw_m=int(os.getenv("INDEX_HNSW_M", cls.hnsw_m)),
+            ef_construction=int(os.getenv("INDEX_HNSW_EF_CONSTRUCTION", cls.ef_construction)),
+            ef_search=int(os.getenv("INDEX_HNSW_EF_SEARCH", cls.ef_search)),
+        )
+
+    def nlist_for(self, count: int) -> int:
+        nlist = self.nlist or int(4 * math.sqrt(count))
+        return max(1, min(nlist, 65536, count // MIN_POINTS_PER_CENTROID))
+
+    def pq_m_for(self, dimension: int) -> int:
+        m = self.pq_m or max(1, dimension // 16)
+        while dimension % m:
+            m -= 1
+        return m
+
+
+def index_mode(index) -> str:
+    if isinstance(index, faiss.IndexFlat):
+        return FLAT
+    if isinstance(index, faiss.IndexHNSW):
+        return HNSW
+    if isinstance(index, faiss.IndexIVFFlat):
+        return IVF_FLAT
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return IVF_SQ
+    if isinstance(index, faiss.IndexIVFPQ):
+        return IVF_PQ
+    return type(index).__name__
+
+
+def choose_mode(count: int, settings: IndexSettings) -> str:
+    """Index type for a corpus of ``count`` vectors."""
+    mode = settings.mode
+    if mode == AUTO:
+        if count >= settings.pq_min:
+            mode = IVF_PQ
+        elif count >= settings.sq_min:
+            mode = IVF_SQ
+        elif count >= settings.ivf_min:
+            mode = IVF_FLAT
+        else:
+            mode = FLAT
+    # IVF needs enough vectors to train its centroids (and PQ its 256 codes)
+    needed = MIN_POINTS_PER_CENTROID * (256 if mode == IVF_PQ else 16)
+    if mode.startswith("ivf") and count < needed:
+        return FLAT
+    return mode
+
+
+def needs_rebuild(index, settings: IndexSettings) -> bool:
+    """True when the index type no longer suits its size, or IVF centroids are stale.
+
+    IVF lists are retrained once the ideal ``nlist`` doubles (roughly a
+    fourfold growth of the corpus since training).
+    """
+    mode = choose_mode(index.ntotal, settings)
+    if index_mode(index) != mode:
+        return True
+    if mode.startswith("ivf") and not settings.nlist:
+        return settings.nlist_for(index.ntotal) >= 2 * index.nlist
+    return False
+
+
+def configure(index, settings: IndexSettings):
+    """Apply search-time parameters, which can change without a rebuild."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(settings.nprobe, index.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.ef_search
+    return index
+
+
+def new_index(mode: str, dimension: int, count: int, settings: IndexSettings):
+    """An empty, untrained index of the given type for about ``count`` vectors."""
+    if mode == FLAT:
+        return faiss.IndexFlatL2(dimension)
+    if mode == HNSW:
+        index = faiss.IndexHNSWFlat(dimension, settings.hnsw_m)
+        index.hnsw.efConstruction = settings.ef_construction
+        return configure(index, settings)
+    nlist = settings.nlist_for(count)
+    quantizer = faiss.IndexFlatL2(dimension)
+    if mode == IVF_FLAT:
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+    elif mode == IVF_SQ:
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_8bit)
+    elif mode == IVF_PQ:
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, settings.pq_m_for(dimension), 8)
+    else:
+        raise ValueError(f"Unknown index mode: {mode}")
+    # MMR and rebuilds reconstruct vectors by position
+    index.make_direct_map()
+    return configure(index, settings)
+
+
+def iter_vectors(index, positions: Optional[np.ndarray] = None) -> Iterator[np.ndarray]:
+    """Reconstruct stored vectors block by block (approximately for SQ/PQ)."""
+    if positions is None:
+        for start in range(0, index.ntotal, RECONSTRUCT_BLOCK):
+            yield index.reconstruct_n(start, min(RECONSTRUCT_BLOCK, index.ntotal - start))
+        return
+    for start in range(0, len(positions), RECONSTRUCT_BLOCK):
+        yield index.reconstruct_batch(positions[start:start + RECONSTRUCT_BLOCK])
+
+
+def train(source, mode: str, settings: IndexSettings, seed: int = 0):
+    """Return an empty index of ``mode`` trained on a sample of ``source``'s vectors."""
+    index = new_index(mode, source.d, source.ntotal, settings)
+    if not index.is_trained:
+        sample_size = min(source.ntotal, 64 * max(index.nlist, 256 if mode == IVF_PQ else 0))
+        sample = np.sort(np.random.default_rng(seed).choice(source.ntotal, sample_size, replace=False))
+        index.train(np.concatenate(list(iter_vectors(source, sample))))
+    return index
+
+
+def fill(index, vectors: Iterable[np.ndarray]):
+    for block in vectors:
+        index.add(np.ascontiguousarray(block, dtype=np.float32))
+    return index
+
+
+def rebuild(source, settings: IndexSettings, trained=None):
+    """Copy ``source``'s vectors, in order, into the index type its size calls for.
+
+    ``trained`` is an empty index trained earlier (possibly on an older
+    version of the corpus) to reuse instead of training again.
+    """
+    mode = choose_mode(source.ntotal, settings)
+    index = trained if trained is not None else train(source, mode, settings)
+    return fill(index, iter_vectors(source))
+
+
+def remove_positions(index, positions: Iterable[int]):
+    """Remove vectors and shift later ones down, like ``IndexFlat.remove_ids``.
+
+    The langchain wrapper maps positions to chunk IDs, so positions must
+    stay dense. Flat indexes compact in place; other types are refilled
+    from their remaining vectors, keeping the trained quantizers.
+    """
+    positions = np.asarray(sorted(set(positions)), dtype=np.int64)
+    if not len(positions):
+        return index
+    if isinstance(index, faiss.IndexFlat):
+        index.remove_ids(positions)
+        return index
+    keep = np.setdiff1d(np.arange(index.ntotal, dtype=np.int64), positions)
+    if isinstance(index, faiss.IndexHNSW):
+        # HNSW graphs cannot drop nodes; this rebuilds the graph
+        empty = new_index(HNSW, index.d, len(keep), IndexSettings(
+            hnsw_m=index.hnsw.nb_neighbors(1), ef_construction=index.hnsw.efConstruction,
+            ef_search=index.hnsw.efSearch,
+        ))
+    else:
+        empty = faiss.clone_index(index)
+        empty.reset()
+    return fill(empty, iter_vectors(index, keep))
@@ -1,24 +1,33 @@
 import requests
 import streamlit as st
 import time
-import pydub
+import queue
 from pathlib import Path
 from streamlit_webrtc import WebRtcMode, webrtc_streamer
 from dotenv import load_dotenv, find_dotenv
+from audio_capture import TARGET_RATE, PcmRingBuffer, frames_to_mono, resample
+from vad import pcm_to_wav
 
 _ = load_dotenv(find_dotenv())
 
 PASTA_TEMP = Path(__file__).parent / 'temp'
 PASTA_TEMP.mkdir(exist_ok=True)
 ARQUIVO_AUDIO_TEMP = PASTA_TEMP / 'audio.mp3'
-ARQUIVO_MIC_TEMP = PASTA_TEMP / 'mic.mp3'
 
 # URL do backend
 BACKEND_URL = "http://localhost:8000"
 
 # Função para chamar o endpoint de transcrição de áudio
 def transcreve_audio(caminho_audio, prompt):
-    files = {'file': open(caminho_audio, 'rb')}
+    with open(caminho_audio, 'rb') as arquivo:
+        return envia_para_transcricao((Path(caminho_audio).name, arquivo), prompt)
+
+# Codifica o segmento do microfone uma única vez, em memória, como WAV 16 kHz
+def transcreve_amostras(amostras, prompt):
+    return envia_para_transcricao(('mic.wav', pcm_to_wav(amostras.tobytes(), TARGET_RATE)), prompt)
+
+def envia_para_transcricao(arquivo, prompt):
+    files = {'file': arquivo}
     data = {'prompt': prompt}  # Pode ser um prompt opcional
     response = requests.post(f"{BACKEND_URL}/audio-to-text/", files=files, data=data)
     
@@ -58,16 +67,9 @@ if not 'transcricao_mic' in st.session_state:
 def get_ice_servers():
     return [{'urls': ['stun:stun.l.google.com:19302']}]
 
-def adiciona_chunck_de_audio(frames_de_audio, chunck_audio):
-    for frame in frames_de_audio:
-        sound = pydub.AudioSegment(
-            data=frame.to_ndarray().tobytes(),
-            sample_width=frame.format.bytes,
-            frame_rate=frame.sample_rate,
-            channels=len(frame.layout.channels)
-        )
-        chunck_audio += sound
-    return chunck_audio
+def adiciona_chunck_de_audio(frames_de_audio, buffer_audio):
+    # Buffer circular pré-alocado: sem cópia do áudio acumulado a cada frame
+    buffer_audio.write(resample(frames_to_mono(frames_de_audio), frames_de_audio[0].sample_rate))
 
 def transcreve_tab_mic():
     prompt_mic = st.text_input('Insira o prompt (optional)', key='input_mic')
@@ -84,7 +86,7 @@ def transcreve_tab_mic():
 
     container = st.empty()
     container.markdown('Inicie a falar...')
-    chunck_audio = pydub.AudioSegment.empty()
+    buffer_audio = PcmRingBuffer(seconds=30)
     tempo_ultima_transcricao = time.time()
     st.session_state['transcricao_mic'] = ''
     while True:
@@ -94,16 +96,16 @@ def transcreve_tab_mic():
             except queue.Empty:
                 time.sleep(0.1)
                 continue
-            chunck_audio = adiciona_chunck_de_audio(frames_de_audio, chunck_audio)
+            if not frames_de_audio:
+                continue
+            adiciona_chunck_de_audio(frames_de_audio, buffer_audio)
 
             agora = time.time()
-            if len(chunck_audio) > 0 and agora - tempo_ultima_transcricao > 10:
+            if len(buffer_audio) > 0 and agora - tempo_ultima_transcricao > 10:
                 tempo_ultima_transcricao = agora
-                chunck_audio.export(ARQUIVO_MIC_TEMP, format='mp3')
-                transcricao = transcreve_audio(ARQUIVO_MIC_TEMP, prompt_mic)
+                transcricao = transcreve_amostras(buffer_audio.read(), prompt_mic)
                 st.session_state['transcricao_mic'] += transcricao
                 container.write(st.session_state['transcricao_mic'])
-                chunck_audio = pydub.AudioSegment.empty()
         else:
             break
 
@@ -0,0 +1,213 @@
+import os
+import time
+import sqlite3
+import asyncio
+import hashlib
+import uuid
+import logging
+import threading
+from functools import partial
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def audio_key(model: str, voice: str, speed: float, text: str, response_format: str = "mp3") -> str:
+    raw = f"{model}\x00{voice}\x00{speed:.3f}\x00{response_format}\x00{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Content-addressed audio files on disk with an LRU byte budget.
+
+    Files live under ``root/<2 hex>/<key>.<format>``; a small SQLite table
+    tracks size and last use so the least recently used files are removed
+    once the total exceeds ``max_bytes``. The entry count and byte total
+    are kept by triggers in a metadata table, shared by every process
+    using the cache, so neither eviction nor ``stats`` scans the table.
+    """
+
+    # Hard links handed out by ``get``; left-overs from a crash are removed at startup
+    SERVING_DIR = ".serving"
+
+    def __init__(self, root: Path, max_bytes: int = 512 * 1024 * 1024):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.serving_dir = self.root / self.SERVING_DIR
+        self.serving_dir.mkdir(exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / "index.sqlite"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS audio ("
+                " key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS audio_last_used ON audio(last_used)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS audio_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            # Seeded once from the table as it stands, for caches created before the totals
+            if self._conn.execute("SELECT 1 FROM audio_meta WHERE name = 'bytes'").fetchone() is None:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO audio_meta (name, value)"
+                    " SELECT 'entries', COUNT(*) FROM audio UNION ALL"
+                    " SELECT 'bytes', COALESCE(SUM(size), 0) FROM audio"
+                )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS audio_totals_insert AFTER INSERT ON audio BEGIN"
+                " UPDATE audio_meta SET value = value + 1 WHERE name = 'entries';"
+                " UPDATE audio_meta SET value = value + NEW.size WHERE name = 'bytes'; END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS audio_totals_update AFTER UPDATE OF size ON audio BEGIN"
+                " UPDATE audio_meta SET value = value + NEW.size - OLD.size WHERE name = 'bytes'; END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS audio_totals_delete AFTER DELETE ON audio BEGIN"
+                " UPDATE audio_meta SET value = value - 1 WHERE name = 'entries';"
+                " UPDATE audio_meta SET value = value - OLD.size WHERE name = 'bytes'; END"
+            )
+        self._entries, self._bytes = self._read_totals()
+        stale = time.time() - 3600
+        for link in self.serving_dir.iterdir():
+            if link.stat().st_mtime < stale:
+                link.unlink(missing_ok=True)
+
+    def _read_totals(self) -> Tuple[int, int]:
+        totals = dict(self._conn.execute("SELECT name, value FROM audio_meta").fetchall())
+        return totals["entries"], totals["bytes"]
+
+    def _path(self, key: str, response_format: str) -> Path:
+        return self.root / key[:2] / f"{key}.{response_format}"
+
+    def get(self, key: str) -> Optional[Path]:
+        """Return a private hard link to the cached audio; the caller unlinks it when done.
+
+        The link is made under the lock, so eviction by any process only
+        removes the cache's own name and the link stays servable (with
+        ``sendfile``, by ``FileResponse``) until the caller is finished.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM audio WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                path = Path(row[0])
+                link = self.serving_dir / f"{uuid.uuid4().hex}{path.suffix}"
+                try:
+                    os.link(path, link)
+                except FileNotFoundError:
+                    link = None
+                if link is not None:
+                    self._conn.execute("UPDATE audio SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._conn.commit()
+                    self.hits += 1
+                    return link
+            self.misses += 1
+            return None
+
+    def put(self, key: str, audio: bytes, response_format: str = "mp3") -> Path:
+        path = self._path(key, response_format)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        tmp.write_bytes(audio)
+        os.replace(tmp, path)
+        with self._lock:
+            # An upsert, unlike INSERT OR REPLACE, keeps the totals' triggers exact
+            self._conn.execute(
+                "INSERT INTO audio (key, path, size, last_used) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET path = excluded.path, size = excluded.size,"
+                " last_used = excluded.last_used",
+                (key, str(path), len(audio), time.time()),
+            )
+            self._entries, self._bytes = self._read_totals()
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+        return path
+
+    def _evict(self):
+        evicted = 0
+        while self._bytes > self.max_bytes:
+            rows = self._conn.execute("SELECT key, path FROM audio ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, path in rows:
+                Path(path).unlink(missing_ok=True)
+                self._conn.execute("DELETE FROM audio WHERE key = ?", (key,))
+                evicted += 1
+                self._entries, self._bytes = self._read_totals()
+                if self._bytes <= self.max_bytes:
+                    break
+        logger.info(f"Evicted {evicted} audio files from cache")
+
+    def stats(self) -> dict:
+        """Counters of this process; ``entries`` and ``bytes`` as of its last write."""
+        requests = self.hits + self.misses
+        return {
+            "entries": self._entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+
+class CachedSpeech:
+    """Speech backend wrapper that serves repeated (model, voice, speed, text) from disk.
+
+    Concurrent requests for the same key share a single synthesis call,
+    which runs as its own task: a cancelled request does not cancel it for
+    the others, and its audio is still cached.
+    """
+
+    def __init__(self, backend, cache: AudioCache, model: Optional[str] = None):
+        self.backend = backend
+        self.cache = cache
+        self.model = model or getattr(backend, "model", type(backend).__name__)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def _synthesize_and_store(self, key: str, text: str, voice: str, speed: float,
+                                    response_format: str) -> bytes:
+        audio = await self.backend.synthesize(text, voice=voice, speed=speed, response_format=response_format)
+        await asyncio.to_thread(self.cache.put, key, audio, response_format)
+        return audio
+
+    def _finished(self, key: str, task: asyncio.Task):
+        del self._in_flight[key]
+        # Every requester may have gone; keep asyncio from warning about it
+        if not task.cancelled():
+            task.exception()
+
+    async def fetch(self, text: str, voice: str = "alloy", speed: float = 1.0,
+                    response_format: str = "mp3") -> Tuple[Optional[Path], Optional[bytes]]:
+        """Return (link to the cached file, None) on a hit, else (None, synthesized audio bytes).
+
+        The caller unlinks a returned path once it has been served.
+        """
+        key = audio_key(self.model, voice, speed, text, response_format)
+        path = await asyncio.to_thread(self.cache.get, key)
+        if path is not None:
+            return path, None
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._synthesize_and_store(key, text, voice, speed, response_format))
+            self._in_flight[key] = task
+            task.add_done_callback(partial(self._finished, key))
+        return None, await asyncio.shield(task)
+
+    async def synthesize(self, text: str, voice: str = "alloy", speed: float = 1.0,
+                         response_format: str = "mp3") -> bytes:
+        path, audio = await self.fetch(text, voice, speed, response_format)
+        if audio is None:
+            try:
+                audio = await asyncio.to_thread(path.read_bytes)
+            finally:
+                path.unlink(missing_ok=True)
+        return audio
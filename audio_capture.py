@@ -0,0 +1,83 @@
+"""Microphone capture helpers for the Streamlit front-ends."""
+import numpy as np
+
+TARGET_RATE = 16000
+
+
+def frames_to_mono(audio_frames) -> np.ndarray:
+    """Downmix a batch of WebRTC audio frames to one float32 mono array."""
+    chunks = []
+    for frame in audio_frames:
+        samples = frame.to_ndarray()
+        channels = len(frame.layout.channels)
+        samples = samples.T if frame.format.is_planar else samples.reshape(-1, channels)
+        chunks.append(samples)
+    return np.concatenate(chunks).mean(axis=1, dtype=np.float32)
+
+
+def resample(samples: np.ndarray, rate: int, target_rate: int = TARGET_RATE) -> np.ndarray:
+    """Resample mono audio to ``target_rate`` as int16 in one vectorized step.
+
+    Integer ratios (48 kHz, 32 kHz) are decimated by averaging each group of
+    samples, which also low-passes; other rates are linearly interpolated.
+    """
+    if rate == target_rate:
+        out = samples
+    elif rate % target_rate == 0:
+        factor = rate // target_rate
+        usable = len(samples) - len(samples) % factor
+        out = samples[:usable].reshape(-1, factor).mean(axis=1)
+    else:
+        count = int(len(samples) * target_rate / rate)
+        out = np.interp(np.arange(count) * (rate / target_rate), np.arange(len(samples)), samples)
+    return np.clip(out, -32768, 32767).astype(np.int16)
+
+
+class PcmRingBuffer:
+    """Preallocated circular buffer of int16 mono samples.
+
+    Writes never allocate; when the buffer is full the oldest samples are
+    overwritten and counted in ``dropped``.
+    """
+
+    def __init__(self, seconds: float = 30.0, sample_rate: int = TARGET_RATE):
+        self.sample_rate = sample_rate
+        self._data = np.zeros(int(seconds * sample_rate), dtype=np.int16)
+        self._start = 0
+        self._size = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def write(self, samples: np.ndarray):
+        capacity = self.capacity
+        if len(samples) > capacity:
+            self.dropped += len(samples) - capacity
+            samples = samples[-capacity:]
+        overflow = self._size + len(samples) - capacity
+        if overflow > 0:
+            self.dropped += overflow
+            self._start = (self._start + overflow) % capacity
+            self._size -= overflow
+        end = (self._start + self._size) % capacity
+        first = min(len(samples), capacity - end)
+        self._data[end:end + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self._size += len(samples)
+
+    def read(self, count: int = None) -> np.ndarray:
+        """Remove and return up to ``count`` of the oldest samples (all by default)."""
+        count = self._size if count is None else min(count, self._size)
+        first = min(count, self.capacity - self._start)
+        out = np.concatenate((self._data[self._start:self._start + first], self._data[:count - first]))
+        self._start = (self._start + count) % self.capacity
+        self._size -= count
+        return out
+
+    def clear(self):
+        self._start = self._size = 0
@@ -0,0 +1,90 @@
+"""ANN index modes: recall vs. latency and memory on synthetic embeddings.
+
+    python benchmarks/ann_recall.py --vectors 100000 --dim 1536 --queries 200
+
+Vectors are drawn around random cluster centres and L2-normalized, which
+is closer to real text embeddings than uniform noise. Every mode is built
+through ann_index (as the server builds it) and swept over its search-time
+knob (nprobe or efSearch); recall@k is measured against exact search and
+latency is per single query, as a request would see it.
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ann_index import FLAT, HNSW, INDEX_MODES, IndexSettings, configure, rebuild  # noqa: E402
+
+
+def make_vectors(count, dim, clusters, spread, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centres[rng.integers(0, clusters, count)]
+    vectors += spread * rng.standard_normal((count, dim), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def recall_at(found, truth, k):
+    return np.mean([len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth)])
+
+
+def measure(index, queries, k):
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    return np.asarray(found), np.asarray(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--spread", type=float, default=1.5, help="noise around cluster centres")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--modes", default=",".join(INDEX_MODES), help="comma-separated subset of modes")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="IVF values to sweep")
+    parser.add_argument("--ef-search", default="16,32,64,128", help="HNSW values to sweep")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads")
+    args = parser.parse_args()
+    faiss.omp_set_num_threads(args.threads)
+
+    data = make_vectors(args.vectors + args.queries, args.dim, args.clusters, args.spread)
+    vectors, queries = data[:args.vectors], data[args.vectors:]
+    source = faiss.IndexFlatL2(args.dim)
+    source.add(vectors)
+    _, truth = source.search(queries, args.k)
+    print(f"{args.vectors} vectors x {args.dim} dims, {args.queries} queries, recall@{args.k}, "
+          f"{args.threads} thread(s)")
+    print(f"{'mode':9s} {'param':>12s} {'recall':>7s} {'p50 ms':>8s} {'p95 ms':>8s} {'build s':>8s} {'MB':>8s}")
+
+    for mode in args.modes.split(","):
+        start = time.perf_counter()
+        index = rebuild(source, IndexSettings(mode=mode))
+        build = time.perf_counter() - start
+        size = faiss.serialize_index(index).nbytes / 1e6
+        if mode == FLAT:
+            sweep = [("-", IndexSettings())]
+        elif mode == HNSW:
+            sweep = [(f"efSearch={ef}", IndexSettings(ef_search=int(ef))) for ef in args.ef_search.split(",")]
+        else:
+            sweep = [(f"nprobe={n}", IndexSettings(nprobe=int(n))) for n in args.nprobe.split(",")]
+        for label, settings in sweep:
+            found, latencies = measure(configure(index, settings), queries, args.k)
+            print(f"{mode:9s} {label:>12s} {recall_at(found, truth, args.k):7.3f} "
+                  f"{np.percentile(latencies, 50):8.3f} {np.percentile(latencies, 95):8.3f} "
+                  f"{build:8.1f} {size:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Cold start of the API: import time and time to ready.
+
+    python benchmarks/cold_start.py --runs 5 --output benchmarks/results/cold-$(git rev-parse --short HEAD).json
+    python benchmarks/suite.py --compare benchmarks/results/cold-old.json benchmarks/results/cold-new.json
+
+Ingests one generated PDF against benchmarks/fake_openai_server.py, then
+starts the API afresh ``--runs`` times on that persisted index, measuring:
+
+- startup.import: ``import main`` in a new interpreter
+- startup.live: launching uvicorn until ``/healthz`` answers
+- startup.ready: launching uvicorn until ``/readyz`` reports ready
+  (index preloaded, clients built)
+- startup.first_query: the first ``/query`` once ready
+
+Results use suite.py's format, so its ``--compare`` flags regressions.
+The modules ``main`` imports that take longest (``python -X importtime``)
+are printed as well, to point at the culprit.
+"""
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+import httpx
+
+from fixtures import make_pdf
+from query_load import QUESTIONS
+from suite import (
+    api_env, report, start_api, start_fake_server, stop_services, summarize, wait_until_up,
+)
+
+IMPORT_MAIN = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def time_import(workdir: Path, env: dict) -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORT_MAIN], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+
+def slowest_imports(workdir: Path, env: dict, count: int) -> List[Tuple[str, float]]:
+    """Modules imported directly by ``main``, by cumulative seconds."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True)
+    found = []
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2]
+        # One space after the bar, then two per nesting level below main
+        if len(name) - len(name.lstrip()) == 3:
+            found.append((name.strip(), int(fields[1]) / 1e6))
+    return sorted(found, key=lambda item: item[1], reverse=True)[:count]
+
+
+def start_once(fake_url: str, workdir: Path, log, question: str) -> Tuple[float, float, float]:
+    """Seconds from launch to live and to ready, and of the first query."""
+    start = time.perf_counter()
+    url, api = start_api(fake_url, workdir, log)
+    try:
+        wait_until_up(f"{url}/healthz", api, ok_only=True, interval=0.01)
+        live = time.perf_counter() - start
+        wait_until_up(f"{url}/readyz", api, ok_only=True, interval=0.01)
+        ready = time.perf_counter() - start
+        start = time.perf_counter()
+        httpx.post(f"{url}/query", json={"question": question, "use_cache": False}, timeout=60).raise_for_status()
+        return live, ready, time.perf_counter() - start
+    finally:
+        stop_services([api])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", type=Path, help="write results as JSON here")
+    parser.add_argument("--runs", type=int, default=5, help="fresh starts to measure")
+    parser.add_argument("--pdf-pages", type=int, default=50, help="size of the indexed PDF")
+    parser.add_argument("--imports", type=int, default=10, help="slowest imports to print")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake provider seconds per request")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="fake seconds between chat tokens")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+    # Fake server knobs start_fake_server expects
+    args.rpm, args.tpm, args.provider_concurrency = 0, 0, 0
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag-cold-start-"))
+    log = (workdir / "services.log").open("w")
+    fake_url, fake = start_fake_server(args, log)
+    try:
+        wait_until_up(f"{fake_url}/stats", fake)
+        url, api = start_api(fake_url, workdir, log)
+        try:
+            wait_until_up(f"{url}/readyz", api, ok_only=True)
+            path = make_pdf(workdir / "fixture.pdf", args.pdf_pages)
+            with path.open("rb") as f:
+                httpx.post(f"{url}/upload", params={"wait": "true"}, timeout=600,
+                           files=[("files", (path.name, f, "application/pdf"))]).raise_for_status()
+        finally:
+            stop_services([api])
+
+        env = api_env(fake_url, workdir)
+        imports, live, ready, first_query = [], [], [], []
+        for run in range(args.runs):
+            print(f"run {run + 1}/{args.runs}...", flush=True)
+            imports.append(time_import(workdir, env))
+            # A new question each run, so the persisted embedding cache cannot answer it
+            question = f"{QUESTIONS[run % len(QUESTIONS)]} ({run})"
+            for samples, seconds in zip((live, ready, first_query), start_once(fake_url, workdir, log, question)):
+                samples.append(seconds)
+        print(f"{'slowest imports of main':40s} seconds")
+        for module, seconds in slowest_imports(workdir, env, args.imports):
+            print(f"  {module:38s} {seconds:.3f}")
+    finally:
+        stop_services([fake])
+        if args.keep:
+            print(f"scratch directory: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    metrics = {}
+    for prefix, samples in (("startup.import", imports), ("startup.live", live), ("startup.ready", ready),
+                            ("startup.first_query", first_query)):
+        metrics.update(summarize(prefix, samples))
+    report(args, metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Embedding throughput: sequential batches vs. EmbeddingScheduler, fully offline.
+
+    python benchmarks/embedding_throughput.py --chunks 2000 --latency 0.2 --rpm 600
+"""
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from embedding_scheduler import EmbeddingScheduler, SchedulerSettings  # noqa: E402
+from fakes import FakeEmbeddingBackend  # noqa: E402
+
+
+def make_texts(count: int):
+    return [f"Trecho {i} do documento. " * 20 for i in range(count)]
+
+
+async def run_sequential(backend, texts, settings):
+    scheduler = EmbeddingScheduler(backend.aembed_documents, settings)
+    start = time.perf_counter()
+    for _, batch, _ in scheduler.make_batches(texts):
+        await backend.aembed_documents(batch)
+    return time.perf_counter() - start
+
+
+async def run_scheduled(backend, texts, settings):
+    scheduler = EmbeddingScheduler(backend.aembed_documents, settings)
+    start = time.perf_counter()
+    await scheduler.embed_all(texts)
+    return time.perf_counter() - start, scheduler.retries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+    parser.add_argument("--rpm", type=int, default=0, help="fake provider requests/minute (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="fake provider tokens/minute (0 = unlimited)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-tokens", type=int, default=8000)
+    args = parser.parse_args()
+
+    texts = make_texts(args.chunks)
+    settings = SchedulerSettings(
+        max_batch_tokens=args.batch_tokens,
+        max_concurrency=args.concurrency,
+        requests_per_minute=args.rpm or SchedulerSettings.requests_per_minute,
+        tokens_per_minute=args.tpm or SchedulerSettings.tokens_per_minute,
+    )
+
+    sequential = asyncio.run(run_sequential(
+        FakeEmbeddingBackend(latency=args.latency), texts, settings))
+    backend = FakeEmbeddingBackend(latency=args.latency, requests_per_minute=args.rpm,
+                                   tokens_per_minute=args.tpm)
+    scheduled, retries = asyncio.run(run_scheduled(backend, texts, settings))
+
+    print(f"chunks={args.chunks} latency={args.latency}s concurrency={args.concurrency}")
+    print(f"sequential: {sequential:.2f}s  {args.chunks / sequential:.0f} chunks/s")
+    print(f"scheduled:  {scheduled:.2f}s  {args.chunks / scheduled:.0f} chunks/s  "
+          f"(rejected={backend.rejected}, retries={retries})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Local OpenAI-compatible server for load-testing the API offline.
+
+    python benchmarks/fake_openai_server.py --port 9000 --latency 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=sk-fake python main.py
+
+Implements the endpoints the API uses: embeddings, chat completions (plain
+and streamed), speech and transcriptions, each with simulated latency, and
+the model list the API requests when it warms up.
+Embeddings are deterministic per text; ``--rpm`` makes it answer 429 and
+``--concurrency`` caps in-flight requests per service (the rest queue).
+"""
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+from contextlib import nullcontext
+from pathlib import Path
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fakes import FakeEmbeddingBackend, FakeRateLimitError, FakeSpeechBackend  # noqa: E402
+
+ANSWER = ("De acordo com o documento, o prazo de entrega é de cinco dias úteis. "
+          "O pagamento deve ser confirmado antes do envio do produto.")
+
+
+def rate_limited() -> JSONResponse:
+    error = {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}
+    return JSONResponse(status_code=429, content={"error": error}, headers={"retry-after": "1"})
+
+
+def create_app(latency: float = 0.2, token_delay: float = 0.02, rpm: int = 0, tpm: int = 0,
+               concurrency: int = 0) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    embedder = FakeEmbeddingBackend(latency=latency, requests_per_minute=rpm, tokens_per_minute=tpm)
+    speaker = FakeSpeechBackend(latency=latency)
+    app.state.counters = {"embeddings": 0, "chat": 0, "speech": 0, "transcriptions": 0}
+    slots = {name: asyncio.Semaphore(concurrency) if concurrency else nullcontext()
+             for name in app.state.counters}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        app.state.counters["embeddings"] += 1
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        texts = [text if isinstance(text, str) else " ".join(map(str, text)) for text in texts]
+        try:
+            async with slots["embeddings"]:
+                vectors = await embedder.aembed_documents(texts)
+        except FakeRateLimitError:
+            return rate_limited()
+        data = []
+        for i, vector in enumerate(vectors):
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        return {"object": "list", "data": data, "model": body.get("model", "fake"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.counters["chat"] += 1
+        model = body.get("model", "fake")
+        tokens = [word + " " for word in ANSWER.split(" ")]
+        created = int(time.time())
+        usage = {"prompt_tokens": 100, "completion_tokens": len(tokens), "total_tokens": 100 + len(tokens)}
+        # A streamed answer holds its slot only until the first token
+        async with slots["chat"]:
+            await asyncio.sleep(latency)
+            if not body.get("stream"):
+                await asyncio.sleep(token_delay * len(tokens))
+
+        if not body.get("stream"):
+            return {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        def chunk(delta, finish_reason=None, **extra):
+            choice = {"index": 0, "delta": delta, "finish_reason": finish_reason}
+            payload = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                       "model": model, "choices": [choice], **extra}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for token in tokens:
+                await asyncio.sleep(token_delay)
+                yield chunk({"content": token})
+            yield chunk({}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                payload = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                           "model": model, "choices": [], "usage": usage}
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        body = await request.json()
+        app.state.counters["speech"] += 1
+        async with slots["speech"]:
+            audio = await speaker.synthesize(body["input"], voice=body.get("voice", "alloy"))
+        return Response(content=audio, media_type="audio/mpeg")
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(file: UploadFile = File(...), model: str = Form("whisper-1"),
+                             response_format: str = Form("json")):
+        app.state.counters["transcriptions"] += 1
+        audio = await file.read()
+        async with slots["transcriptions"]:
+            await asyncio.sleep(latency + len(audio) / 1_000_000)
+        text = "Qual é o prazo de entrega do produto?"
+        if response_format == "text":
+            return PlainTextResponse(text)
+        return {"text": text}
+
+    @app.get("/v1/models")
+    async def models():
+        names = ("text-embedding-ada-002", "gpt-3.5-turbo", "tts-1", "whisper-1")
+        return {"object": "list", "data": [{"id": name, "object": "model", "created": 0, "owned_by": "fake"}
+                                           for name in names]}
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.counters, "rate_limited": embedder.rejected}
+
+    return app
+
+
+app = create_app(
+    latency=float(os.getenv("FAKE_OPENAI_LATENCY", "0.2")),
+    token_delay=float(os.getenv("FAKE_OPENAI_TOKEN_DELAY", "0.02")),
+    rpm=int(os.getenv("FAKE_OPENAI_RPM", "0")),
+    tpm=int(os.getenv("FAKE_OPENAI_TPM", "0")),
+    concurrency=int(os.getenv("FAKE_OPENAI_CONCURRENCY", "0")),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before each response")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--rpm", type=int, default=0, help="embedding requests per minute before 429")
+    parser.add_argument("--tpm", type=int, default=0, help="embedding tokens per minute before 429")
+    parser.add_argument("--concurrency", type=int, default=0, help="in-flight requests per service (0 = unlimited)")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.token_delay, args.rpm, args.tpm, args.concurrency),
+                host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
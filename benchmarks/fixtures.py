@@ -0,0 +1,62 @@
+"""Generated inputs for the benchmarks: text PDFs and speech-like WAV audio."""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from vad import pcm_to_wav  # noqa: E402
+
+
+def page_lines(page: int, lines: int):
+    return [f"Pagina {page} linha {line}: artigo {page * 100 + line} texto de exemplo sobre o produto X-{line}."
+            for line in range(lines)]
+
+
+def make_pdf(path: Path, pages: int, lines_per_page: int = 40) -> Path:
+    """Write a minimal text-only PDF (Helvetica, one content stream per page)."""
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")
+    kids = []
+    for page in range(pages):
+        text = " ".join(f"({line}) '" for line in page_lines(page, lines_per_page))
+        content = f"BT /F1 10 Tf 40 800 Td 12 TL {text} ET".encode("latin-1")
+        stream = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, stream, font)
+        ))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    path = Path(path)
+    path.write_bytes(bytes(out))
+    return path
+
+
+def make_speech_wav(seconds: float = 3.0, sample_rate: int = 16000, seed: int = 0) -> bytes:
+    """Syllable-like bursts of a modulated tone, separated by short pauses."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = (np.sin(2 * np.pi * 3 * t) > -0.3).astype(np.float32)
+    signal = np.sin(2 * np.pi * (180 + 40 * np.sin(2 * np.pi * 2 * t)) * t) * envelope
+    signal += 0.01 * rng.standard_normal(len(t))
+    return pcm_to_wav((signal * 12000).astype(np.int16).tobytes(), sample_rate)
@@ -0,0 +1,126 @@
+"""Peak memory of PDF ingestion by document size.
+
+    python benchmarks/ingest_memory.py --pdf-pages 100,500,2000
+
+Starts the fake OpenAI server and the API like suite.py, uploads one
+generated PDF per size (each into its own collection) and samples, from
+/proc (Linux only), the private memory (RssAnon) of the API process and
+of its parser workers; file-backed pages such as memory-mapped indexes
+are reclaimable and left out. Peaks are split by job phase: "stream"
+(parsing and embedding) should stay flat as documents grow, "publish"
+(merging into the index and writing it) grows with the index itself.
+"""
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+import httpx
+
+from fixtures import make_pdf
+from suite import start_services, stop_services
+
+
+def rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+    return 0
+
+
+def children(pid: int):
+    pids = []
+    for task in Path(f"/proc/{pid}/task").glob("*"):
+        try:
+            pids.extend(int(child) for child in (task / "children").read_text().split())
+        except FileNotFoundError:
+            continue
+    return pids
+
+
+class PeakSampler:
+    """Poll the memory of a process and its children on a background thread.
+
+    Peaks are kept per ``phase``, which the caller switches as it goes.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.02):
+        self.pid = pid
+        self.interval = interval
+        self.phase = "stream"
+        self.peaks = {}
+        self.peak_workers = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peaks[self.phase] = max(self.peaks.get(self.phase, 0), rss_bytes(self.pid))
+            self.peak_workers = max(self.peak_workers, sum(rss_bytes(child) for child in children(self.pid)))
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf-pages", default="100,500,2000", help="sizes of the generated PDFs")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake provider seconds per request")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+    # Fake server knobs start_services expects
+    args.token_delay, args.rpm, args.tpm, args.provider_concurrency = 0.0, 0, 0, 0
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag-memory-"))
+    url, processes = start_services(args, workdir)
+    api = processes[1]
+    try:
+        print(f"{'pages':>6s} {'chunks':>7s} {'seconds':>8s} {'base MB':>8s} {'stream +MB':>11s} "
+              f"{'publish +MB':>12s} {'workers MB':>11s}")
+        with httpx.Client(base_url=url, timeout=None) as client:
+            for pages in [int(pages) for pages in args.pdf_pages.split(",")]:
+                path = make_pdf(workdir / f"fixture-{pages}.pdf", pages)
+                before = rss_bytes(api.pid)
+                start = time.perf_counter()
+                with PeakSampler(api.pid) as sampler:
+                    with path.open("rb") as f:
+                        response = client.post("/upload", params={"collection": f"mem{pages}"},
+                                               files=[("files", (path.name, f, "application/pdf"))])
+                    response.raise_for_status()
+                    while True:
+                        job = client.get(f"/jobs/{response.json()['job_id']}").json()
+                        if job["status"] not in ("queued", "running"):
+                            break
+                        if job["pages_total"] and job["pages_parsed"] == job["pages_total"] \
+                                and job["chunks_embedded"] == job["chunks_total"]:
+                            sampler.phase = "publish"
+                        time.sleep(0.05)
+                elapsed = time.perf_counter() - start
+                if job["status"] != "succeeded":
+                    raise RuntimeError(f"ingest of {pages} pages {job['status']}: {job['error']}")
+                grown = {phase: (peak - before) / 1e6 for phase, peak in sampler.peaks.items()}
+                print(f"{pages:6d} {job['chunks_total']:7d} {elapsed:8.1f} {before / 1e6:8.1f} "
+                      f"{grown.get('stream', 0):11.1f} {grown.get('publish', 0):12.1f} "
+                      f"{sampler.peak_workers / 1e6:11.1f}")
+    finally:
+        stop_services(processes)
+        if args.keep:
+            print(f"scratch directory: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
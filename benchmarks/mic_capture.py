@@ -0,0 +1,87 @@
+"""Mic capture: pydub segment concatenation vs. the NumPy ring buffer.
+
+    python benchmarks/mic_capture.py --seconds 10 --batch 5
+
+Feeds synthetic 48 kHz stereo WebRTC frames (20 ms each) through both
+capture paths, then encodes the segment once, and reports frames per
+second and peak traced memory.
+"""
+import sys
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+
+import av
+import numpy as np
+import pydub
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from audio_capture import TARGET_RATE, PcmRingBuffer, frames_to_mono, resample  # noqa: E402
+from vad import pcm_to_wav  # noqa: E402
+
+RATE = 48000
+FRAME_SAMPLES = 960
+
+
+def make_frames(count):
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(count):
+        samples = rng.integers(-3000, 3000, size=(1, FRAME_SAMPLES * 2), dtype=np.int16)
+        frame = av.AudioFrame.from_ndarray(samples, format="s16", layout="stereo")
+        frame.sample_rate = RATE
+        frames.append(frame)
+    return frames
+
+
+def pydub_capture(batches):
+    """The previous add_audio_chunk: one AudioSegment per frame, appended with +=."""
+    chunk_audio = pydub.AudioSegment.empty()
+    for batch in batches:
+        for frame in batch:
+            sound = pydub.AudioSegment(
+                data=frame.to_ndarray().tobytes(),
+                sample_width=frame.format.bytes,
+                frame_rate=frame.sample_rate,
+                channels=len(frame.layout.channels),
+            )
+            chunk_audio += sound
+    chunk_audio = chunk_audio.set_channels(1).set_frame_rate(TARGET_RATE)
+    return pcm_to_wav(chunk_audio.raw_data, TARGET_RATE)
+
+
+def ring_capture(batches, seconds):
+    buffer = PcmRingBuffer(seconds=seconds + 1)
+    for batch in batches:
+        buffer.write(resample(frames_to_mono(batch), batch[0].sample_rate))
+    return pcm_to_wav(buffer.read().tobytes(), TARGET_RATE)
+
+
+def measure(name, fn, frame_count):
+    tracemalloc.start()
+    start = time.perf_counter()
+    wav = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:8s} {frame_count / elapsed:10.0f} frames/s   "
+          f"{elapsed * 1000:8.1f} ms   peak {peak / 1e6:7.1f} MB   wav {len(wav) / 1e6:.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10.0, help="segment length")
+    parser.add_argument("--batch", type=int, default=5, help="frames returned per get_frames call")
+    args = parser.parse_args()
+
+    frames = make_frames(int(args.seconds * RATE / FRAME_SAMPLES))
+    batches = [frames[i:i + args.batch] for i in range(0, len(frames), args.batch)]
+    print(f"{len(frames)} frames of 20 ms at {RATE} Hz stereo, {args.batch} per batch")
+    measure("pydub", lambda: pydub_capture(batches), len(frames))
+    measure("ring", lambda: ring_capture(batches, args.seconds), len(frames))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Concurrent load against a running API's /query endpoint.
+
+    python benchmarks/query_load.py --url http://127.0.0.1:8000 --requests 200 --concurrency 32
+
+Run the API against benchmarks/fake_openai_server.py to measure the
+server's own overhead and concurrency without spending real API calls.
+Semantic caching is disabled per request so every query goes end to end.
+"""
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+QUESTIONS = [
+    "Qual é o prazo de entrega?",
+    "Como é feito o pagamento?",
+    "Quais são as condições de devolução?",
+    "Quem é responsável pelo frete?",
+]
+
+
+async def run(url: str, requests: int, concurrency: int, stream: bool):
+    latencies, errors = [], 0
+    gate = asyncio.Semaphore(concurrency)
+    path = "/query/stream" if stream else "/query"
+
+    async with httpx.AsyncClient(base_url=url, timeout=120,
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one(i):
+            nonlocal errors
+            body = {"question": QUESTIONS[i % len(QUESTIONS)], "use_cache": False}
+            async with gate:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, json=body)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--stream", action="store_true", help="use /query/stream")
+    args = parser.parse_args()
+
+    latencies, errors, elapsed = asyncio.run(run(args.url, args.requests, args.concurrency, args.stream))
+    print(f"{len(latencies)} ok, {errors} errors in {elapsed:.2f}s ({len(latencies) / elapsed:.1f} req/s)")
+    if latencies:
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"latency p50 {statistics.median(latencies) * 1000:.0f} ms   "
+              f"p95 {p95 * 1000:.0f} ms   max {latencies[-1] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
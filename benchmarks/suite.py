@@ -0,0 +1,409 @@
+"""Offline end-to-end benchmarks for the ingest, query and audio paths.
+
+    python benchmarks/suite.py --output benchmarks/results/$(git rev-parse --short HEAD).json
+    python benchmarks/suite.py --compare benchmarks/results/old.json benchmarks/results/new.json
+
+Starts benchmarks/fake_openai_server.py and the API (main.py under uvicorn)
+as subprocesses in a scratch directory, so nothing touches OpenAI or the
+local index. Then:
+
+- ingest: generated PDFs of each ``--pdf-pages`` size, one collection each
+- query: ``/query`` under concurrent load (p50/p95/p99)
+- stream: ``/query/stream`` time-to-first-token
+- batch: the ``--requests`` questions of the query phase as one ``/query/batch``
+- tts: ``/text-to-audio`` latency and ``/text-to-audio/stream`` time-to-first-audio
+- stt: ``/audio-to-text`` latency
+- voice: ``/voice-query`` time-to-first-audio
+
+Results are one flat ``{"metric": value}`` map plus run metadata, so two
+runs can be diffed with ``--compare``.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Tuple
+
+import httpx
+import numpy as np
+
+from fixtures import make_pdf, make_speech_wav
+from query_load import QUESTIONS
+
+ROOT = Path(__file__).resolve().parent.parent
+PHASES = ("ingest", "query", "stream", "batch", "tts", "stt", "voice")
+SENTENCE = "O contrato prevê a entrega do produto em até cinco dias úteis após a confirmação do pagamento."
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 120, ok_only: bool = False,
+                  interval: float = 0.2):
+    """Poll ``url`` until it answers (with a 2xx when ``ok_only``)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).is_success or not ok_only:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(interval)
+    raise TimeoutError(f"{url} did not start within {timeout}s")
+
+
+def start_fake_server(args, log) -> Tuple[str, subprocess.Popen]:
+    port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, str(ROOT / "benchmarks" / "fake_openai_server.py"), "--port", str(port),
+         "--latency", str(args.latency), "--token-delay", str(args.token_delay),
+         "--rpm", str(args.rpm), "--tpm", str(args.tpm), "--concurrency", str(args.provider_concurrency)],
+        stdout=log, stderr=subprocess.STDOUT,
+    )
+    return f"http://127.0.0.1:{port}", fake
+
+
+def api_env(fake_url: str, workdir: Path) -> dict:
+    """Environment for running the API in ``workdir`` against the fake server."""
+    return dict(os.environ, OPENAI_BASE_URL=f"{fake_url}/v1", OPENAI_API_KEY="sk-fake",
+                PERSIST_DIRECTORY=str(workdir / "db"), PYTHONPATH=str(ROOT))
+
+
+def start_api(fake_url: str, workdir: Path, log) -> Tuple[str, subprocess.Popen]:
+    port = free_port()
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=api_env(fake_url, workdir), stdout=log, stderr=subprocess.STDOUT,
+    )
+    return f"http://127.0.0.1:{port}", api
+
+
+def start_services(args, workdir: Path):
+    log = (workdir / "services.log").open("w")
+    fake_url, fake = start_fake_server(args, log)
+    api_url, api = start_api(fake_url, workdir, log)
+    processes = [fake, api]
+    try:
+        wait_until_up(f"{fake_url}/stats", fake)
+        wait_until_up(f"{api_url}/readyz", api, ok_only=True)
+    except Exception:
+        stop_services(processes)
+        raise
+    return api_url, processes
+
+
+def stop_services(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def summarize(prefix: str, samples, errors: int = 0, elapsed: float = 0.0) -> dict:
+    """Percentiles in milliseconds for a list of durations in seconds."""
+    metrics = {f"{prefix}.count": len(samples), f"{prefix}.errors": errors}
+    if samples:
+        values = np.asarray(samples) * 1000
+        for q in (50, 95, 99):
+            metrics[f"{prefix}.p{q}_ms"] = round(float(np.percentile(values, q)), 2)
+        metrics[f"{prefix}.mean_ms"] = round(float(values.mean()), 2)
+    if elapsed:
+        metrics[f"{prefix}.requests_per_s"] = round(len(samples) / elapsed, 2)
+    return metrics
+
+
+async def load(requests: int, concurrency: int, call):
+    """Run ``call(i)`` ``requests`` times, ``concurrency`` at a time.
+
+    ``call`` returns a dict of named durations (seconds); returns their
+    lists, the error count and the wall time.
+    """
+    gate = asyncio.Semaphore(concurrency)
+    timings, errors = {}, 0
+
+    async def one(i):
+        nonlocal errors
+        async with gate:
+            try:
+                for name, value in (await call(i)).items():
+                    timings.setdefault(name, []).append(value)
+            except (httpx.HTTPError, RuntimeError):
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return timings, errors, time.perf_counter() - start
+
+
+async def first_event(response: httpx.Response, event: str, start: float):
+    """Read an SSE response to the end; returns when ``event`` first arrived."""
+    first = None
+    async for line in response.aiter_lines():
+        if line == "event: error":
+            raise RuntimeError("stream reported an error")
+        if first is None and line == f"event: {event}":
+            first = time.perf_counter() - start
+    if first is None:
+        raise RuntimeError(f"no {event} event")
+    return first
+
+
+async def bench_ingest(client, args, workdir: Path) -> dict:
+    metrics = {}
+    for pages in args.pdf_pages:
+        path = make_pdf(workdir / f"fixture-{pages}.pdf", pages)
+        start = time.perf_counter()
+        with path.open("rb") as f:
+            response = await client.post("/upload", params={"wait": "true", "collection": f"bench{pages}"},
+                                         files=[("files", (path.name, f, "application/pdf"))])
+        elapsed = time.perf_counter() - start
+        response.raise_for_status()
+        job = response.json()
+        prefix = f"ingest.pdf{pages}"
+        metrics.update({
+            f"{prefix}.seconds": round(elapsed, 3),
+            f"{prefix}.chunks": job["chunks_total"],
+            f"{prefix}.pages_per_s": round(pages / elapsed, 2),
+            f"{prefix}.chunks_per_s": round(job["chunks_total"] / elapsed, 2),
+        })
+    return metrics
+
+
+async def bench_query(client, args, collection: str) -> dict:
+    async def call(i):
+        start = time.perf_counter()
+        body = {"question": QUESTIONS[i % len(QUESTIONS)], "collection": collection, "use_cache": False}
+        (await client.post("/query", json=body)).raise_for_status()
+        return {"latency": time.perf_counter() - start}
+
+    timings, errors, elapsed = await load(args.requests, args.concurrency, call)
+    return summarize("query", timings.get("latency", []), errors, elapsed)
+
+
+async def bench_stream(client, args, collection: str) -> dict:
+    async def call(i):
+        start = time.perf_counter()
+        body = {"question": QUESTIONS[i % len(QUESTIONS)], "collection": collection, "use_cache": False}
+        async with client.stream("POST", "/query/stream", json=body) as response:
+            response.raise_for_status()
+            first = await first_event(response, "token", start)
+        return {"first_token": first, "latency": time.perf_counter() - start}
+
+    timings, errors, elapsed = await load(args.requests, args.concurrency, call)
+    metrics = summarize("stream.first_token", timings.get("first_token", []), errors)
+    metrics.update(summarize("stream", timings.get("latency", []), errors, elapsed))
+    return metrics
+
+
+async def bench_batch(client, args, collection: str) -> dict:
+    questions = [QUESTIONS[i % len(QUESTIONS)] + f" ({i})" for i in range(args.requests)]
+    start = time.perf_counter()
+    response = await client.post("/query/batch", json={"questions": questions, "collection": collection,
+                                                       "use_cache": False})
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    return {
+        "batch.seconds": round(elapsed, 3),
+        "batch.questions_per_s": round(len(questions) / elapsed, 2),
+        "batch.errors": response.json()["stats"]["errors"],
+    }
+
+
+async def bench_tts(client, args, run_id: str) -> dict:
+    # Unique texts, so every request misses the TTS cache
+    async def whole(i):
+        start = time.perf_counter()
+        data = {"input_text": f"{SENTENCE} Pedido {run_id}-a{i}."}
+        (await client.post("/text-to-audio", data=data)).raise_for_status()
+        return {"latency": time.perf_counter() - start}
+
+    async def streamed(i):
+        start = time.perf_counter()
+        data = {"input_text": f"{SENTENCE} {SENTENCE} Pedido {run_id}-s{i}."}
+        first = None
+        async with client.stream("POST", "/text-to-audio/stream", data=data) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                if first is None and chunk:
+                    first = time.perf_counter() - start
+        return {"first_audio": first, "latency": time.perf_counter() - start}
+
+    requests = max(1, args.requests // 2)
+    timings, errors, elapsed = await load(requests, args.concurrency, whole)
+    metrics = summarize("tts", timings.get("latency", []), errors, elapsed)
+    timings, errors, _ = await load(requests, args.concurrency, streamed)
+    metrics.update(summarize("tts_stream.first_audio", timings.get("first_audio", []), errors))
+    metrics.update(summarize("tts_stream", timings.get("latency", []), errors))
+    return metrics
+
+
+async def bench_stt(client, args, wav: bytes) -> dict:
+    async def call(i):
+        start = time.perf_counter()
+        response = await client.post("/audio-to-text", files={"file": ("question.wav", wav, "audio/wav")})
+        response.raise_for_status()
+        return {"latency": time.perf_counter() - start}
+
+    timings, errors, elapsed = await load(max(1, args.requests // 2), args.concurrency, call)
+    return summarize("stt", timings.get("latency", []), errors, elapsed)
+
+
+async def bench_voice(client, args, wav: bytes, collection: str) -> dict:
+    async def call(i):
+        start = time.perf_counter()
+        data = {"collection": collection, "use_cache": "false"}
+        async with client.stream("POST", "/voice-query", data=data,
+                                 files={"file": ("question.wav", wav, "audio/wav")}) as response:
+            response.raise_for_status()
+            first = await first_event(response, "audio", start)
+        return {"first_audio": first, "latency": time.perf_counter() - start}
+
+    timings, errors, _ = await load(max(1, args.requests // 4), args.concurrency, call)
+    metrics = summarize("voice.first_audio", timings.get("first_audio", []), errors)
+    metrics.update(summarize("voice", timings.get("latency", []), errors))
+    return metrics
+
+
+async def run_phases(url: str, args, workdir: Path) -> dict:
+    metrics = {}
+    collection = f"bench{max(args.pdf_pages)}"
+    wav = make_speech_wav()
+    run_id = str(int(time.time()))
+    async with httpx.AsyncClient(base_url=url, timeout=600,
+                                 limits=httpx.Limits(max_connections=args.concurrency + 4)) as client:
+        if "ingest" in args.phases:
+            metrics.update(await bench_ingest(client, args, workdir))
+        elif {"query", "stream", "voice"} & set(args.phases):
+            # Querying needs an index even when ingest is not being measured
+            await bench_ingest(client, argparse.Namespace(pdf_pages=[max(args.pdf_pages)]), workdir)
+        benches = {
+            "query": lambda: bench_query(client, args, collection),
+            "stream": lambda: bench_stream(client, args, collection),
+            "batch": lambda: bench_batch(client, args, collection),
+            "tts": lambda: bench_tts(client, args, run_id),
+            "stt": lambda: bench_stt(client, args, wav),
+            "voice": lambda: bench_voice(client, args, wav, collection),
+        }
+        for phase in args.phases:
+            if phase in benches:
+                print(f"running {phase}...", flush=True)
+                metrics.update(await benches[phase]())
+    return metrics
+
+
+def git_revision():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                             cwd=ROOT, text=True).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def regressed(metric: str, before: float, after: float, threshold: float) -> bool:
+    if metric.endswith(".errors"):
+        return after > before
+    if metric.endswith((".count", ".chunks")):
+        return False
+    change = (after - before) / before if before else 0.0
+    return change < -threshold if metric.endswith("_per_s") else change > threshold
+
+
+def compare(old_path: Path, new_path: Path, threshold: float) -> int:
+    """Print every shared metric with its relative change; 1 if any regressed past ``threshold``."""
+    old, new = (json.loads(Path(path).read_text())["metrics"] for path in (old_path, new_path))
+    regressions = 0
+    print(f"{'metric':40s} {'old':>12s} {'new':>12s} {'change':>8s}")
+    for metric in sorted(old.keys() & new.keys()):
+        before, after = old[metric], new[metric]
+        change = (after - before) / before if before else 0.0
+        worse = regressed(metric, before, after, threshold)
+        regressions += worse
+        print(f"{metric:40s} {before:12.2f} {after:12.2f} {change:+8.1%}{'  REGRESSION' if worse else ''}")
+    for metric in sorted(old.keys() ^ new.keys()):
+        print(f"{metric:40s} only in {'old' if metric in old else 'new'}")
+    return 1 if regressions else 0
+
+
+def report(args, metrics: dict):
+    """Print the metrics and, with ``--output``, write them with the run metadata."""
+    commit, dirty = git_revision()
+    results = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {key: value if not isinstance(value, Path) else str(value)
+                     for key, value in vars(args).items() if key not in ("output", "compare", "keep")},
+        },
+        "metrics": metrics,
+    }
+    for metric, value in metrics.items():
+        print(f"{metric:40s} {value}")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"wrote {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", type=Path, help="write results as JSON here")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("OLD", "NEW"),
+                        help="diff two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--phases", default=",".join(PHASES), help=f"comma-separated subset of {PHASES}")
+    parser.add_argument("--pdf-pages", default="5,50,200", help="sizes of the generated PDFs")
+    parser.add_argument("--requests", type=int, default=100, help="requests per query phase")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake provider seconds per request")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="fake seconds between chat tokens")
+    parser.add_argument("--rpm", type=int, default=0, help="fake embedding requests/minute (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="fake embedding tokens/minute (0 = unlimited)")
+    parser.add_argument("--provider-concurrency", type=int, default=0,
+                        help="fake in-flight requests per service (0 = unlimited)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+
+    args.phases = [phase for phase in args.phases.split(",") if phase]
+    args.pdf_pages = [int(pages) for pages in args.pdf_pages.split(",")]
+    workdir = Path(tempfile.mkdtemp(prefix="rag-bench-"))
+    url, processes = start_services(args, workdir)
+    try:
+        metrics = asyncio.run(run_phases(url, args, workdir))
+    finally:
+        stop_services(processes)
+        if args.keep:
+            print(f"scratch directory: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report(args, metrics)
+
+
+if __name__ == "__main__":
+    main()
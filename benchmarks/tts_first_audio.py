@@ -0,0 +1,56 @@
+"""Time-to-first-audio: one-shot synthesis vs. sentence-pipelined streaming, offline.
+
+    python benchmarks/tts_first_audio.py --sentences 8 --parallel 3
+"""
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fakes import FakeSpeechBackend  # noqa: E402
+from tts import split_sentences, stream_speech  # noqa: E402
+
+SENTENCE = ("O contrato prevê a entrega do produto em até cinco dias úteis, "
+            "contados a partir da confirmação do pagamento.")
+
+
+async def one_shot(backend, text):
+    """Current /text-to-audio path: the whole text in a single request."""
+    start = time.perf_counter()
+    await backend.synthesize(text)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+async def pipelined(backend, text, parallel):
+    start = time.perf_counter()
+    first = None
+    async for _ in stream_speech(split_sentences(text), backend.synthesize, parallel):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sentences", type=int, default=8)
+    parser.add_argument("--parallel", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.3, help="fixed seconds per request")
+    parser.add_argument("--per-char", type=float, default=0.004, help="seconds per input character")
+    args = parser.parse_args()
+
+    text = " ".join([SENTENCE] * args.sentences)
+    backend = FakeSpeechBackend(latency=args.latency, per_char_latency=args.per_char)
+    first_a, total_a = asyncio.run(one_shot(backend, text))
+    first_b, total_b = asyncio.run(pipelined(backend, text, args.parallel))
+
+    print(f"{len(text)} chars, {args.sentences} sentences, parallel={args.parallel}")
+    print(f"one-shot:  first audio {first_a * 1000:7.0f} ms   complete {total_a * 1000:7.0f} ms")
+    print(f"pipelined: first audio {first_b * 1000:7.0f} ms   complete {total_b * 1000:7.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ann_index import IndexSettings, choose_mode, needs_rebuild, rebuild, train
+from index_store import IndexSnapshot, IndexStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = "default"
+COLLECTIONS_DIR = "collections"
+COLLECTION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class CollectionNotFound(KeyError):
+    pass
+
+
+class CollectionManager:
+    """Named document collections, each with its own persisted index.
+
+    The default collection lives directly in ``root`` (where the single
+    index always was); the others under ``root/collections/<id>``. Indexes
+    are loaded on first use and kept resident in least-recently-used order:
+    once the resident ones exceed ``memory_budget`` bytes, the coldest are
+    unloaded (they are already on disk) and reloaded on their next query.
+    The collection being accessed is never evicted, so a single collection
+    larger than the budget still works.
+
+    The budget is an approximation counted in on-disk bytes: a collection
+    counts as the size of its published version directory. Memory-mapped
+    index and BM25 files are paged in by the kernel and shared between
+    workers, so the memory they actually take lies anywhere from nothing
+    to that size, while the unpickled docstore takes somewhat more than
+    its file.
+
+    When a collection outgrows its FAISS index type (see ``ann_index``),
+    it is rebuilt on a background thread: the new index is trained from a
+    snapshot without blocking writers, then filled and published under the
+    collection's write lock.
+
+    A collection created by an upload is only registered (listed, and
+    found by queries) once its first publish succeeds, so a failed first
+    upload leaves no empty collection behind.
+    """
+
+    def __init__(self, root: Path, embeddings, memory_budget: int, keep_versions: int = 2,
+                 index_settings: Optional[IndexSettings] = None):
+        self.root = Path(root)
+        self.embeddings = embeddings
+        self.memory_budget = memory_budget
+        self.keep_versions = keep_versions
+        self.index_settings = index_settings or IndexSettings()
+        self._stores: Dict[str, IndexStore] = {}
+        # Created by an upload but not yet published; shared by concurrent uploads
+        self._pending: Dict[str, IndexStore] = {}
+        self._resident: "OrderedDict[str, None]" = OrderedDict()
+        self._stats: Dict[str, dict] = {}
+        self._rebuilding = set()
+        self._builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-build")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def validate(collection: str) -> str:
+        if not COLLECTION_ID_PATTERN.match(collection):
+            raise ValueError("Collection IDs are 1-64 letters, digits, '-' or '_'")
+        return collection
+
+    def _path(self, collection: str) -> Path:
+        if collection == DEFAULT_COLLECTION:
+            return self.root
+        return self.root / COLLECTIONS_DIR / collection
+
+    def store(self, collection: str, create: bool = False) -> IndexStore:
+        """Return the collection's store; unknown IDs raise unless ``create``.
+
+        With ``create``, an unknown collection gets a store that stays
+        unregistered until ``update`` first publishes to it.
+        """
+        self.validate(collection)
+        with self._lock:
+            store = self._stores.get(collection)
+            if store is not None:
+                return store
+            path = self._path(collection)
+            # The default collection always exists, even before the first upload
+            if collection == DEFAULT_COLLECTION or (path / "manifest.json").exists():
+                return self._register(collection, IndexStore(path, self.embeddings, self.keep_versions,
+                                                             self.index_settings))
+            if not create:
+                raise CollectionNotFound(collection)
+            store = self._pending.get(collection)
+            if store is None:
+                store = self._pending[collection] = IndexStore(path, self.embeddings, self.keep_versions,
+                                                               self.index_settings)
+            return store
+
+    def _register(self, collection: str, store: IndexStore) -> IndexStore:
+        # Called with self._lock held
+        self._pending.pop(collection, None)
+        self._stores[collection] = store
+        self._stats[collection] = {"last_access": None, "loads": 0, "evictions": 0}
+        return store
+
+    def names(self) -> List[str]:
+        """Every collection with a published index, on disk or loaded."""
+        names = set(self._stores)
+        if (self.root / "manifest.json").exists():
+            names.add(DEFAULT_COLLECTION)
+        collections_dir = self.root / COLLECTIONS_DIR
+        if collections_dir.exists():
+            names.update(path.name for path in collections_dir.iterdir() if (path / "manifest.json").exists())
+        return sorted(names)
+
+    def snapshot(self, collection: str, create: bool = False) -> IndexSnapshot:
+        """Load the collection if needed and return its current snapshot."""
+        store = self.store(collection, create)
+        if collection not in self._stores:
+            # Not published yet, so there is nothing to load
+            return store.snapshot()
+        was_resident = store.resident
+        snapshot = store.snapshot()
+        loaded = not was_resident and store.resident
+        self._touch(collection, store, loaded)
+        if loaded:
+            self._check_index(collection, snapshot)
+        return snapshot
+
+    def update(self, collection: str, mutate: Callable) -> IndexSnapshot:
+        """Publish a change to a collection, creating it on first upload."""
+        store = self.store(collection, create=True)
+        was_resident = store.resident
+        store.update(mutate)
+        with self._lock:
+            if collection not in self._stores:
+                self._register(collection, store)
+        snapshot = store.snapshot()
+        self._touch(collection, store, loaded=not was_resident and store.resident)
+        self._check_index(collection, snapshot)
+        return snapshot
+
+    def _check_index(self, collection: str, snapshot: IndexSnapshot):
+        vectorstore = snapshot.vectorstore
+        if vectorstore is None or not needs_rebuild(vectorstore.index, self.index_settings):
+            return
+        with self._lock:
+            if collection in self._rebuilding:
+                return
+            self._rebuilding.add(collection)
+        self._builder.submit(self._rebuild, collection)
+
+    def _rebuild(self, collection: str):
+        try:
+            source = self.snapshot(collection).vectorstore.index
+            mode = choose_mode(source.ntotal, self.index_settings)
+            logger.info(f"Training {mode} index for collection {collection} ({source.ntotal} vectors)")
+            started = time.perf_counter()
+            trained = train(source, mode, self.index_settings)
+
+            def apply(vectorstore):
+                # Chunks added meanwhile are filled into the trained index too
+                if choose_mode(vectorstore.index.ntotal, self.index_settings) == mode:
+                    vectorstore.index = rebuild(vectorstore.index, self.index_settings, trained)
+                else:
+                    vectorstore.index = rebuild(vectorstore.index, self.index_settings)
+                return vectorstore
+
+            self.update(collection, apply)
+            logger.info(f"Rebuilt collection {collection} as {mode} in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"Error rebuilding index for collection {collection}: {str(e)}")
+        finally:
+            with self._lock:
+                self._rebuilding.discard(collection)
+
+    def shutdown(self):
+        self._builder.shutdown(wait=False, cancel_futures=True)
+
+    def _touch(self, collection: str, store: IndexStore, loaded: bool):
+        evicted = []
+        with self._lock:
+            stats = self._stats[collection]
+            stats["last_access"] = time.time()
+            if loaded:
+                stats["loads"] += 1
+                logger.info(f"Loaded collection {collection} ({store.resident_bytes} bytes)")
+            if store.resident:
+                self._resident[collection] = None
+                self._resident.move_to_end(collection)
+            while self.resident_bytes() > self.memory_budget and len(self._resident) > 1:
+                coldest = next(iter(self._resident))
+                if coldest == collection:
+                    break
+                del self._resident[coldest]
+                self._stats[coldest]["evictions"] += 1
+                evicted.append(coldest)
+                self._stores[coldest].unload()
+        for name in evicted:
+            logger.info(f"Evicted collection {name} to stay within {self.memory_budget} bytes")
+
+    def resident_bytes(self) -> int:
+        return sum(self._stores[name].resident_bytes for name in list(self._resident))
+
+    def evict(self, collection: str) -> bool:
+        """Unload a collection now; False if it was not resident."""
+        with self._lock:
+            if collection not in self._resident:
+                return False
+            del self._resident[collection]
+            self._stats[collection]["evictions"] += 1
+            self._stores[collection].unload()
+        logger.info(f"Evicted collection {collection}")
+        return True
+
+    def describe(self, collection: str) -> dict:
+        store = self.store(collection)
+        manifest = store._read_manifest() or {}
+        stats = self._stats[collection]
+        return {
+            "collection": collection,
+            "resident": store.resident,
+            "version": manifest.get("version", 0),
+            "num_vectors": manifest.get("num_vectors", 0),
+            "index_mode": manifest.get("index_mode", "flat"),
+            "rebuilding": collection in self._rebuilding,
+            "disk_bytes": store.disk_bytes(),
+            "resident_bytes": store.resident_bytes,
+            "last_access": stats["last_access"],
+            "loads": stats["loads"],
+            "evictions": stats["evictions"],
+        }
+
+    def stats(self) -> dict:
+        return {
+            "memory_budget_bytes": self.memory_budget,
+            "resident_bytes": self.resident_bytes(),
+            "resident": list(self._resident),
+            "collections": [self.describe(name) for name in self.names()],
+        }
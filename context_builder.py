@@ -0,0 +1,188 @@
+import os
+import re
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from embedding_scheduler import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+PASSAGE_SEPARATOR = "\n\n"
+# Sentence ends and line breaks; spans are the unit of deduplication and packing
+SPAN_BOUNDARY = re.compile(r"(?<=[.!?;:])\s+|\n+")
+WORD = re.compile(r"\w+")
+# Shortest suffix/prefix match taken as the splitter's chunk overlap
+MIN_OVERLAP = 8
+MAX_OVERLAP = 200
+
+
+@dataclass(frozen=True)
+class ContextSettings:
+    """How retrieved chunks are packed into the prompt."""
+    max_tokens: int = 3000  # 0 = no budget
+    shingle_size: int = 5  # words per shingle
+    # A span is dropped when this share of its shingles is already in the context
+    duplicate_threshold: float = 0.8
+    # tiktoken encoding, or "estimate" for ~4 characters per token
+    tokenizer: str = "cl100k_base"
+
+    @classmethod
+    def from_env(cls) -> "ContextSettings":
+        return cls(
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", cls.max_tokens)),
+            shingle_size=int(os.getenv("CONTEXT_SHINGLE_SIZE", cls.shingle_size)),
+            duplicate_threshold=float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", cls.duplicate_threshold)),
+            tokenizer=os.getenv("CONTEXT_TOKENIZER", cls.tokenizer),
+        )
+
+
+class Passage(NamedTuple):
+    """Consecutive chunks of one page, merged."""
+    chunk_ids: List[str]
+    metadata: dict
+    text: str
+    relevance: float
+
+
+class BuiltContext(NamedTuple):
+    text: str
+    tokens: int
+    # What joining the retrieved chunks as they are would have cost
+    raw_tokens: int
+    chunks: int
+    passages: int
+    dropped_spans: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.tokens)
+
+
+def load_tokenizer(name: str) -> Callable[[str], int]:
+    """Token counter for ``name``; falls back to the estimate when tiktoken cannot load it."""
+    if name == "estimate":
+        return estimate_tokens
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"Tokenizer {name} unavailable ({type(e).__name__}), estimating tokens from length")
+        return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def chunk_position(doc: Document) -> Optional[Tuple[str, int]]:
+    """(doc_id, position) from an ingest chunk ID ``<doc_id>:<position>``."""
+    doc_id, _, position = (doc.id or "").rpartition(":")
+    return (doc_id, int(position)) if doc_id and position.isdigit() else None
+
+
+def join_overlapping(left: str, right: str) -> str:
+    """Concatenate consecutive chunks, dropping the text the splitter repeated."""
+    for size in range(min(len(left), len(right), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+
+def merge_adjacent(hits: List[Tuple[Document, float]]) -> List[Passage]:
+    """Merge hits that are consecutive chunks of the same page; best passage first."""
+    ordered = sorted(
+        enumerate(hits),
+        key=lambda item: (chunk_position(item[1][0]) or (f"~{item[0]}", 0), item[0]),
+    )
+    passages: List[Passage] = []
+    previous = None
+    for _, (doc, relevance) in ordered:
+        position = chunk_position(doc)
+        page = doc.metadata.get("page")
+        if (passages and position and previous and position[0] == previous[0][0]
+                and position[1] == previous[0][1] + 1 and page == previous[1]):
+            last = passages[-1]
+            passages[-1] = last._replace(
+                chunk_ids=last.chunk_ids + [doc.id],
+                text=join_overlapping(last.text, doc.page_content),
+                relevance=max(last.relevance, relevance),
+            )
+        else:
+            passages.append(Passage([doc.id], doc.metadata, doc.page_content, relevance))
+        previous = (position, page) if position else None
+    return sorted(passages, key=lambda passage: passage.relevance, reverse=True)
+
+
+class ContextBuilder:
+    """Turn retrieved chunks into a compact, token-budgeted prompt context.
+
+    Consecutive chunks of a page are merged (dropping the splitter's
+    overlap), passages are ordered by relevance, spans whose word shingles
+    are mostly in the context already are dropped as near-duplicates, and
+    spans are packed until ``max_tokens`` is reached.
+    """
+
+    def __init__(self, settings: Optional[ContextSettings] = None):
+        self.settings = settings or ContextSettings()
+        self._count: Optional[Callable[[str], int]] = None
+        self._lock = threading.Lock()
+
+    def count_tokens(self, text: str) -> int:
+        if self._count is None:
+            with self._lock:
+                if self._count is None:
+                    self._count = load_tokenizer(self.settings.tokenizer)
+        return self._count(text)
+
+    def shingles(self, span: str) -> set:
+        words = WORD.findall(span.lower())
+        size = self.settings.shingle_size
+        if len(words) <= size:
+            return {hash(tuple(words))} if words else set()
+        return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+    def build(self, hits: List[Tuple[Document, float]]) -> BuiltContext:
+        settings = self.settings
+        raw_tokens = self.count_tokens(PASSAGE_SEPARATOR.join(doc.page_content for doc, _ in hits))
+        passages = merge_adjacent(hits)
+        separator_tokens = self.count_tokens(PASSAGE_SEPARATOR)
+
+        seen = set()
+        kept_passages = []
+        tokens = 0
+        dropped = 0
+        full = False
+        for passage in passages:
+            kept = []
+            for span in SPAN_BOUNDARY.split(passage.text):
+                span = span.strip()
+                if not span:
+                    continue
+                shingles = self.shingles(span)
+                # Punctuation left over from a split carries nothing either
+                if not shingles or len(shingles & seen) >= settings.duplicate_threshold * len(shingles):
+                    dropped += 1
+                    continue
+                cost = self.count_tokens(span) + (separator_tokens if not kept and kept_passages else 1)
+                if settings.max_tokens and tokens + cost > settings.max_tokens:
+                    full = True
+                    dropped += 1
+                    continue
+                seen |= shingles
+                kept.append(span)
+                tokens += cost
+            if kept:
+                kept_passages.append(" ".join(kept))
+        if full:
+            logger.info(f"Context budget of {settings.max_tokens} tokens reached")
+
+        text = PASSAGE_SEPARATOR.join(kept_passages)
+        return BuiltContext(
+            text=text,
+            tokens=self.count_tokens(text),
+            raw_tokens=raw_tokens,
+            chunks=len(hits),
+            passages=len(kept_passages),
+            dropped_spans=dropped,
+        )
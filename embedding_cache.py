@@ -0,0 +1,214 @@
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def _as_float32(vector: Sequence[float]) -> List[float]:
+    # Misses return the same float32-rounded values a later hit would
+    return np.asarray(vector, dtype=np.float32).tolist()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed by (model, normalized text hash).
+
+    Entries carry a last-used timestamp; once the table grows past
+    ``max_entries`` the least recently used rows are evicted, down to
+    ``evict_to`` (a fraction of ``max_entries``). The row count is kept
+    by triggers in a metadata row, so every process sharing the file sees
+    the same count without scanning the table. Hits update ``last_used``
+    in batches, at most every ``touch_interval`` seconds, rather than
+    with a write on every read.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 200_000, evict_to: float = 0.9,
+                 touch_interval: float = 30.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.evict_to = evict_to
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._last_touch_flush = time.monotonic()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            # Seeded once from the table as it stands, for caches created before the counter
+            if self._conn.execute("SELECT 1 FROM cache_meta WHERE name = 'entries'").fetchone() is None:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO cache_meta (name, value) SELECT 'entries', COUNT(*) FROM embeddings"
+                )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_count_insert AFTER INSERT ON embeddings BEGIN"
+                " UPDATE cache_meta SET value = value + 1 WHERE name = 'entries'; END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_count_delete AFTER DELETE ON embeddings BEGIN"
+                " UPDATE cache_meta SET value = value - 1 WHERE name = 'entries'; END"
+            )
+        self._entries = self._read_count()
+
+    def _read_count(self) -> int:
+        (count,) = self._conn.execute("SELECT value FROM cache_meta WHERE name = 'entries'").fetchone()
+        return count
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            now = time.time()
+            self._touched.update((key, now) for key in found)
+            if time.monotonic() - self._last_touch_flush >= self.touch_interval:
+                self._flush_touched()
+                self._conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+        self._last_touch_flush = time.monotonic()
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            # An upsert, unlike INSERT OR REPLACE, fires the insert trigger only for new keys
+            self._conn.executemany(
+                "INSERT INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET vector = excluded.vector, last_used = excluded.last_used",
+                rows,
+            )
+            self._entries = self._read_count()
+            if self._entries > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Recent hits must count before choosing the least recently used
+        self._flush_touched()
+        overflow = self._entries - int(self.max_entries * self.evict_to)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (overflow,),
+        )
+        self._entries = self._read_count()
+        logger.info(f"Evicted {overflow} embeddings from cache")
+
+    def stats(self) -> dict:
+        """Counters of this process; ``entries`` as of its last write."""
+        total = self.hits + self.misses
+        return {
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying model."""
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model: Optional[str] = None):
+        self.underlying = underlying
+        self.cache = cache
+        self.model = model or getattr(underlying, "model", type(underlying).__name__)
+
+    def _lookup(self, texts: List[str]):
+        keys = [cache_key(self.model, text) for text in texts]
+        found = self.cache.get_many(keys)
+        # Embed each distinct missing text once, even if repeated in the batch
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return keys, found, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = {key: _as_float32(vector) for key, vector in zip(missing.keys(), vectors)}
+            self.cache.put_many(fresh)
+            found.update(fresh)
+        return [found[key] for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            fresh = {key: _as_float32(vector) for key, vector in zip(missing.keys(), vectors)}
+            await asyncio.to_thread(self.cache.put_many, fresh)
+            found.update(fresh)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model, text)
+        found = self.cache.get_many([key])
+        if key in found:
+            return found[key]
+        vector = _as_float32(self.underlying.embed_query(text))
+        self.cache.put_many({key: vector})
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model, text)
+        found = await asyncio.to_thread(self.cache.get_many, [key])
+        if key in found:
+            return found[key]
+        vector = _as_float32(await self.underlying.aembed_query(text))
+        await asyncio.to_thread(self.cache.put_many, {key: vector})
+        return vector
@@ -0,0 +1,296 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for budgeting."""
+    return len(text) // 4 + 1
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """The provider's requested pause, from ``retry-after-ms`` or ``retry-after``."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        try:
+            return float(headers.get(name)) / scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+@dataclass(frozen=True)
+class SchedulerSettings:
+    max_batch_tokens: int = 8000
+    max_batch_size: int = 256
+    max_concurrency: int = 4
+    requests_per_minute: int = 3000
+    tokens_per_minute: int = 1_000_000
+    max_retries: int = 6
+    base_backoff: float = 0.5
+    max_backoff: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "SchedulerSettings":
+        return cls(
+            max_batch_tokens=int(os.getenv("EMBED_MAX_BATCH_TOKENS", cls.max_batch_tokens)),
+            max_batch_size=int(os.getenv("EMBED_MAX_BATCH_SIZE", cls.max_batch_size)),
+            max_concurrency=int(os.getenv("EMBED_MAX_CONCURRENCY", cls.max_concurrency)),
+            requests_per_minute=int(os.getenv("EMBED_RPM", cls.requests_per_minute)),
+            tokens_per_minute=int(os.getenv("EMBED_TPM", cls.tokens_per_minute)),
+        )
+
+
+class RateLimiter:
+    """Token buckets for requests-per-minute and tokens-per-minute."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int):
+        # A batch larger than the whole minute budget waits for a full bucket
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait_requests = (1 - self._requests) * 60 / self.rpm if self._requests < 1 else 0
+                wait_tokens = (tokens - self._tokens) * 60 / self.tpm if self._tokens < tokens else 0
+                await asyncio.sleep(max(wait_requests, wait_tokens))
+
+    def pause(self, seconds: float):
+        """Hold every caller back, e.g. after the provider answered 429."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveConcurrency:
+    """Concurrency limit that halves on rate limiting and creeps back up on success."""
+
+    def __init__(self, maximum: int, increase_after: int = 8):
+        self.maximum = maximum
+        self.limit = maximum
+        self.increase_after = increase_after
+        self._in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def succeeded(self):
+        self._successes += 1
+        if self._successes >= self.increase_after and self.limit < self.maximum:
+            self.limit += 1
+            self._successes = 0
+
+    def throttled(self):
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+
+
+class EmbeddingScheduler:
+    """Embed many texts as concurrent, token-budgeted batches.
+
+    Batches run under an adaptive concurrency limit and RPM/TPM token
+    buckets; rate-limit errors trigger jittered exponential backoff.
+    ``stream`` yields ``(offset, vectors)`` as each batch completes, so
+    callers can append to an index before the whole corpus is embedded.
+    """
+
+    def __init__(self, embed_fn: EmbedFn, settings: Optional[SchedulerSettings] = None,
+                 token_counter: Callable[[str], int] = estimate_tokens):
+        self.embed_fn = embed_fn
+        self.settings = settings or SchedulerSettings()
+        self.token_counter = token_counter
+        self.limiter = RateLimiter(self.settings.requests_per_minute, self.settings.tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(self.settings.max_concurrency)
+        self.batches_done = 0
+        self.retries = 0
+        self.tokens_embedded = 0
+
+    def _batcher(self) -> "Batcher":
+        return Batcher(self.settings.max_batch_tokens, self.settings.max_batch_size, self.token_counter)
+
+    def make_batches(self, texts: Iterable[str]) -> Iterator[Tuple[int, List[str], int]]:
+        """Yield (offset, texts, tokens) groups within the batch token budget."""
+        batcher = self._batcher()
+        for text in texts:
+            batch = batcher.add(text)
+            if batch is not None:
+                yield batch
+        batch = batcher.flush()
+        if batch is not None:
+            yield batch
+
+    async def _embed_batch(self, texts: List[str], tokens: int) -> List[List[float]]:
+        settings = self.settings
+        async with self.concurrency:
+            for attempt in range(settings.max_retries + 1):
+                await self.limiter.acquire(tokens)
+                try:
+                    vectors = await self.embed_fn(texts)
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt == settings.max_retries:
+                        raise
+                    delay = retry_after_seconds(e) or min(
+                        settings.max_backoff, settings.base_backoff * 2 ** attempt
+                    ) * random.uniform(0.5, 1.5)
+                    self.retries += 1
+                    self.concurrency.throttled()
+                    self.limiter.pause(delay)
+                    logger.warning(f"Embedding rate limited, retrying in {delay:.2f}s "
+                                   f"(concurrency now {self.concurrency.limit})")
+                    await asyncio.sleep(delay)
+                    continue
+                self.concurrency.succeeded()
+                self.batches_done += 1
+                self.tokens_embedded += tokens
+                return vectors
+
+    async def stream(self, texts: List[str]) -> AsyncIterator[Tuple[int, List[List[float]]]]:
+        """Yield (offset, vectors) for each batch in completion order."""
+        done: asyncio.Queue = asyncio.Queue()
+
+        async def run(offset: int, batch: List[str], tokens: int):
+            try:
+                await done.put((offset, await self._embed_batch(batch, tokens)))
+            except Exception as e:
+                await done.put(e)
+
+        tasks = [asyncio.create_task(run(*batch)) for batch in self.make_batches(texts)]
+        try:
+            for _ in range(len(tasks)):
+                item = await done.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stream_from(self, texts: AsyncIterable[str],
+                          max_pending: Optional[int] = None) -> AsyncIterator[Tuple[int, List[List[float]]]]:
+        """``stream`` for texts that are still being produced, with backpressure.
+
+        At most ``max_pending`` batches (default twice the concurrency) are
+        in flight or waiting to be consumed; ``texts`` is not read further
+        until the caller catches up, so memory stays bounded however long
+        the input is. Offsets count from the first text of ``texts``.
+        """
+        max_pending = max_pending or 2 * self.settings.max_concurrency
+        done: asyncio.Queue = asyncio.Queue()
+        tasks = set()
+
+        async def run(offset: int, batch: List[str], tokens: int):
+            try:
+                await done.put((offset, await self._embed_batch(batch, tokens)))
+            except Exception as e:
+                await done.put(e)
+
+        def launch(batch):
+            task = asyncio.create_task(run(*batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        batcher = self._batcher()
+        source = texts.__aiter__()
+        exhausted = False
+        submitted = received = 0
+        try:
+            while True:
+                while not exhausted and submitted - received < max_pending:
+                    try:
+                        batch = batcher.add(await source.__anext__())
+                    except StopAsyncIteration:
+                        exhausted = True
+                        batch = batcher.flush()
+                    if batch is not None:
+                        launch(batch)
+                        submitted += 1
+                if received == submitted:
+                    return
+                item = await done.get()
+                received += 1
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for task in list(tasks):
+                task.cancel()
+
+    async def embed_all(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        async for offset, batch_vectors in self.stream(texts):
+            vectors[offset:offset + len(batch_vectors)] = batch_vectors
+        return vectors
+
+
+class Batcher:
+    """Group a stream of texts into batches within a token and size budget."""
+
+    def __init__(self, max_batch_tokens: int, max_batch_size: int,
+                 token_counter: Callable[[str], int] = estimate_tokens):
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.token_counter = token_counter
+        self.offset = 0
+        self._texts: List[str] = []
+        self._tokens = 0
+
+    def add(self, text: str) -> Optional[Tuple[int, List[str], int]]:
+        """Add a text; returns the previous batch if this one did not fit in it."""
+        tokens = self.token_counter(text)
+        full = len(self._texts) >= self.max_batch_size
+        batch = None
+        if self._texts and (full or self._tokens + tokens > self.max_batch_tokens):
+            batch = self.flush()
+        self._texts.append(text)
+        self._tokens += tokens
+        return batch
+
+    def flush(self) -> Optional[Tuple[int, List[str], int]]:
+        if not self._texts:
+            return None
+        batch = (self.offset, self._texts, self._tokens)
+        self.offset += len(self._texts)
+        self._texts, self._tokens = [], 0
+        return batch
@@ -0,0 +1,94 @@
+"""Local stand-ins for OpenAI services, used for offline benchmarks."""
+import time
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_scheduler import estimate_tokens
+
+
+class FakeRateLimitError(Exception):
+    """Mimics the provider's HTTP 429 response."""
+    status_code = 429
+
+
+class FakeEmbeddingBackend(Embeddings):
+    """Deterministic embeddings with simulated latency and rate limits.
+
+    Each request costs ``latency + tokens * per_token_latency`` seconds.
+    Requests beyond ``requests_per_minute`` / ``tokens_per_minute`` in a
+    sliding one-minute window fail with ``FakeRateLimitError``.
+    """
+
+    def __init__(self, size: int = 1536, latency: float = 0.05, per_token_latency: float = 0.0,
+                 requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.size = size
+        self.model = f"fake-embedding-{size}"
+        self.latency = latency
+        self.per_token_latency = per_token_latency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests = 0
+        self.rejected = 0
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _admit(self, texts: List[str]) -> float:
+        tokens = sum(estimate_tokens(text) for text in texts)
+        now = time.monotonic()
+        with self._lock:
+            while self._window and now - self._window[0][0] > 60:
+                self._window.popleft()
+            used_requests = len(self._window)
+            used_tokens = sum(t for _, t in self._window)
+            if (self.requests_per_minute and used_requests >= self.requests_per_minute) or \
+                    (self.tokens_per_minute and used_tokens + tokens > self.tokens_per_minute):
+                self.rejected += 1
+                raise FakeRateLimitError("Rate limit reached")
+            self._window.append((now, tokens))
+            self.requests += 1
+        return self.latency + tokens * self.per_token_latency
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._admit(texts))
+        return [self._vector(text) for text in texts]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._admit(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeSpeechBackend:
+    """Text-to-speech stand-in whose latency grows with the input length.
+
+    Returns ``bytes_per_char`` bytes of silence per character, roughly the
+    size of real MP3 output, after ``latency + len(text) * per_char_latency``.
+    """
+
+    def __init__(self, latency: float = 0.3, per_char_latency: float = 0.004, bytes_per_char: int = 200):
+        self.latency = latency
+        self.per_char_latency = per_char_latency
+        self.bytes_per_char = bytes_per_char
+        self.requests = 0
+
+    async def synthesize(self, text: str, voice: str = "alloy", speed: float = 1.0,
+                         response_format: str = "mp3") -> bytes:
+        self.requests += 1
+        await asyncio.sleep(self.latency + len(text) * self.per_char_latency)
+        return bytes(len(text) * self.bytes_per_char)
@@ -3,17 +3,21 @@ import streamlit as st
 import requests
 import time
 import queue
-import pydub
 from pathlib import Path
+from urllib.parse import urlencode
 from streamlit_webrtc import WebRtcMode, webrtc_streamer
+from websockets.sync.client import connect
+from audio_capture import TARGET_RATE, PcmRingBuffer, frames_to_mono, resample
 import base64
+import json
 
 # Constants and Setup
 BACKEND_URL = "http://localhost:8000"
+STT_WS_URL = BACKEND_URL.replace("http", "ws", 1) + "/ws/audio-to-text"
+PACKET_SAMPLES = TARGET_RATE // 10  # 100 ms of 16 kHz audio per WebSocket message
 TEMP_DIR = Path(__file__).parent / 'temp'
 TEMP_DIR.mkdir(exist_ok=True)
 AUDIO_TEMP = TEMP_DIR / 'audio.mp3'
-MIC_TEMP = TEMP_DIR / 'mic.mp3'
 
 # Initialize session state
 def initialize_session_state():
@@ -23,8 +27,8 @@ def initialize_session_state():
         st.session_state.uploaded_files = False
     if "transcription_mic" not in st.session_state:
         st.session_state.transcription_mic = ""
-    if "last_transcription_time" not in st.session_state:
-        st.session_state.last_transcription_time = time.time()
+    if "collection" not in st.session_state:
+        st.session_state.collection = "default"
 
 # Helper Functions
 def get_ice_servers():
@@ -41,49 +45,113 @@ def play_audio(audio_bytes):
 
 def process_audio_chunk(audio_file, prompt=""):
     """Process audio file for transcription"""
-    files = {'file': open(audio_file, 'rb')}
-    data = {'prompt': prompt}
-    response = requests.post(f"{BACKEND_URL}/audio-to-text", files=files, data=data)
+    with open(audio_file, 'rb') as audio:
+        response = requests.post(f"{BACKEND_URL}/audio-to-text", files={'file': audio}, data={'prompt': prompt})
     if response.status_code == 200:
         return response.json().get("transcription", "")
     return ""
 
-def add_audio_chunk(audio_frames, chunk_audio):
-    """Add audio frames to chunk"""
-    for frame in audio_frames:
-        sound = pydub.AudioSegment(
-            data=frame.to_ndarray().tobytes(),
-            sample_width=frame.format.bytes,
-            frame_rate=frame.sample_rate,
-            channels=len(frame.layout.channels)
-        )
-        chunk_audio += sound
-    return chunk_audio
+def render_transcript(transcripts, partial=""):
+    """Finished utterances in order, followed by the one still being spoken"""
+    text = " ".join(transcripts[segment] for segment in sorted(transcripts))
+    if partial:
+        text = f"{text} _{partial}_".strip()
+    return text
+
+def finish_stream(ws, transcripts):
+    """Tell the backend the stream ended and collect the remaining transcripts"""
+    ws.send(json.dumps({"type": "end"}))
+    try:
+        while True:
+            message = json.loads(ws.recv(timeout=30))
+            if message["type"] == "final":
+                transcripts[message["segment"]] = message["text"]
+            elif message["type"] == "done":
+                break
+    except TimeoutError:
+        pass
 
 # Core Functions
 def upload_files(files):
+    """Start an ingestion job and return its ID"""
     files_to_upload = [("files", file) for file in files]
-    response = requests.post(f"{BACKEND_URL}/upload", files=files_to_upload)
-    return response.status_code == 200
+    response = requests.post(f"{BACKEND_URL}/upload", files=files_to_upload,
+                             params={"collection": st.session_state.collection})
+    if response.status_code == 202:
+        return response.json()["job_id"]
+    return None
 
-def query_documents(question):
-    response = requests.post(
-        f"{BACKEND_URL}/query",
-        json={"question": question}
-    )
-    if response.status_code == 200:
-        response_data = response.json()
-        
-        # Generate audio response
-        audio_response = requests.post(
-            f"{BACKEND_URL}/text-to-audio",
-            data={"input_text": response_data["response"]}
+def wait_for_job(job_id, progress_bar, status_text):
+    """Poll an ingestion job until it finishes, updating the progress widgets"""
+    while True:
+        response = requests.get(f"{BACKEND_URL}/jobs/{job_id}")
+        if response.status_code != 200:
+            return False
+        job = response.json()
+        if job["pages_total"]:
+            parsed = job["pages_parsed"] / job["pages_total"]
+            embedded = job["chunks_embedded"] / job["chunks_total"] if job["chunks_total"] else 0.0
+            progress_bar.progress(min(1.0, (parsed + embedded) / 2))
+        status_text.caption(
+            f"{job['pages_parsed']}/{job['pages_total']} páginas · "
+            f"{job['chunks_embedded']}/{job['chunks_total']} trechos · "
+            f"{job['chunks_per_second']} trechos/s"
         )
-        if audio_response.status_code == 200:
-            play_audio(audio_response.content)
-            
-        return response_data["response"]
-    return None
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return job["status"] == "succeeded"
+        time.sleep(1)
+
+def iter_sse_events(response):
+    """Parse a text/event-stream response into (event, data) pairs"""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+def stream_query(question, answer):
+    """Yield answer tokens from /query/stream; the full text ends up in answer"""
+    body = {"question": question, "collection": st.session_state.collection}
+    with requests.post(f"{BACKEND_URL}/query/stream", json=body, stream=True) as response:
+        if response.status_code != 200:
+            raise RuntimeError(response.json().get("detail", "Erro ao processar sua pergunta"))
+        for event, data in iter_sse_events(response):
+            if event == "token":
+                yield data["token"]
+            elif event == "done":
+                answer["text"] = data["response"]
+            elif event == "error":
+                raise RuntimeError(data["detail"])
+
+def stream_voice_query(audio_file, prompt, result):
+    """Yield answer tokens from /voice-query; transcript, audio and timings end up in result"""
+    files = {"file": (audio_file.name, audio_file.getvalue())}
+    data = {"prompt": prompt, "collection": st.session_state.collection}
+    with requests.post(f"{BACKEND_URL}/voice-query", files=files, data=data, stream=True) as response:
+        if response.status_code != 200:
+            raise RuntimeError(response.json().get("detail", "Erro ao processar sua pergunta"))
+        result["audio"] = []
+        for event, data in iter_sse_events(response):
+            if event == "transcript":
+                result["question"] = data["text"]
+            elif event == "token":
+                yield data["token"]
+            elif event == "audio":
+                result["audio"].append(base64.b64decode(data["audio"]))
+            elif event == "timings":
+                result["timings"] = data
+            elif event == "error":
+                raise RuntimeError(data["detail"])
+
+def play_answer(text):
+    audio_response = requests.post(f"{BACKEND_URL}/text-to-audio", data={"input_text": text})
+    if audio_response.status_code == 200:
+        play_audio(audio_response.content)
 
 def voice_input_tab():
     st.header("Entrada por Voz")
@@ -104,37 +172,54 @@ def voice_input_tab():
     
     if webrtc_ctx.state.playing:
         status_indicator.info("🎤 Gravando... Fale algo!")
-        chunk_audio = pydub.AudioSegment.empty()
+        # Frames are resampled to 16 kHz mono and streamed as raw PCM;
+        # the backend segments speech and transcribes
+        ws = None
+        capture = PcmRingBuffer()
+        transcripts, partial = {}, ""
+        previous = st.session_state.transcription_mic
         
-        while True:
-            if webrtc_ctx.audio_receiver:
+        try:
+            while webrtc_ctx.audio_receiver:
                 try:
                     audio_frames = webrtc_ctx.audio_receiver.get_frames(timeout=1)
-                    chunk_audio = add_audio_chunk(audio_frames, chunk_audio)
-                    
-                    # Process every 3 seconds instead of 5
-                    current_time = time.time()
-                    if len(chunk_audio) >= 3000 and current_time - st.session_state.last_transcription_time >= 3:
-                        st.session_state.last_transcription_time = current_time
-                        
-                        # Export and process audio chunk
-                        chunk_audio.export(MIC_TEMP, format="mp3")
-                        transcription = process_audio_chunk(MIC_TEMP, prompt_mic)
-                        
-                        if transcription.strip():
-                            st.session_state.transcription_mic += " " + transcription
-                            transcription_output.markdown(f"**Transcrição:**\n{st.session_state.transcription_mic}")
-                        
-                        # Reset audio chunk
-                        chunk_audio = pydub.AudioSegment.empty()
-                        
                 except queue.Empty:
                     continue
-                except Exception as e:
-                    status_indicator.error(f"Erro: {str(e)}")
-                    break
-            else:
-                break
+                if not audio_frames:
+                    continue
+                if ws is None:
+                    query = urlencode({"sample_rate": TARGET_RATE, "prompt": prompt_mic})
+                    ws = connect(f"{STT_WS_URL}?{query}")
+                capture.write(resample(frames_to_mono(audio_frames), audio_frames[0].sample_rate))
+                while len(capture) >= PACKET_SAMPLES:
+                    ws.send(capture.read(PACKET_SAMPLES).tobytes())
+                
+                # Show whatever transcripts have arrived, without blocking capture
+                while True:
+                    try:
+                        message = json.loads(ws.recv(timeout=0))
+                    except TimeoutError:
+                        break
+                    if message["type"] == "partial":
+                        partial = message["text"]
+                    elif message["type"] == "final":
+                        transcripts[message["segment"]] = message["text"]
+                        partial = ""
+                    elif message["type"] == "error":
+                        status_indicator.warning(f"Erro na transcrição: {message['detail']}")
+                    st.session_state.transcription_mic = f"{previous} {render_transcript(transcripts)}".strip()
+                    transcription_output.markdown(
+                        f"**Transcrição:**\n{previous} {render_transcript(transcripts, partial)}"
+                    )
+        except Exception as e:
+            status_indicator.error(f"Erro: {str(e)}")
+        finally:
+            if ws is not None:
+                if len(capture):
+                    ws.send(capture.read().tobytes())
+                finish_stream(ws, transcripts)
+                ws.close()
+                st.session_state.transcription_mic = f"{previous} {render_transcript(transcripts)}".strip()
     else:
         if st.session_state.transcription_mic:
             transcription_output.markdown(f"**Última transcrição:**\n{st.session_state.transcription_mic}")
@@ -161,12 +246,18 @@ def chat_tab():
             st.warning("Por favor, faça o upload de um PDF primeiro.", icon="🚨")
             return
         
-        with st.spinner("Processando..."):
-            response = query_documents(prompt)
-            if response:
-                st.session_state.messages.append({"role": "assistant", "content": response})
-            else:
-                st.error("Erro ao processar sua pergunta")
+        with st.chat_message("user"):
+            st.write(prompt)
+        with st.chat_message("assistant"):
+            answer = {}
+            try:
+                st.write_stream(stream_query(prompt, answer))
+            except Exception as e:
+                st.error(f"Erro ao processar sua pergunta: {e}")
+                return
+        if answer.get("text"):
+            st.session_state.messages.append({"role": "assistant", "content": answer["text"]})
+            play_answer(answer["text"])
 
 def text_to_speech_tab():
     st.header("Texto para Áudio")
@@ -194,13 +285,32 @@ def text_to_speech_tab():
 def audio_to_text_tab():
     st.header("Áudio para Texto")
     prompt_input = st.text_input('Prompt opcional para transcrição:', key='input_audio')
-    uploaded_audio = st.file_uploader('Upload de arquivo de áudio (.mp3)', type=['mp3'])
+    uploaded_audio = st.file_uploader(
+        'Upload de arquivo de áudio',
+        type=['mp3', 'wav', 'm4a', 'ogg', 'webm', 'flac']
+    )
+    ask_documents = st.checkbox("Perguntar aos documentos e ouvir a resposta")
     
-    if uploaded_audio:
-        with open(AUDIO_TEMP, 'wb') as f:
+    if uploaded_audio and ask_documents:
+        # Transcription, retrieval, answer and speech in a single request
+        result = {}
+        try:
+            st.write_stream(stream_voice_query(uploaded_audio, prompt_input, result))
+        except Exception as e:
+            st.error(f"Erro ao processar sua pergunta: {e}")
+            return
+        if result.get("question"):
+            st.caption(f"Pergunta: {result['question']}")
+        if result.get("audio"):
+            st.audio(b"".join(result["audio"]), format="audio/mp3", autoplay=True)
+        if result.get("timings"):
+            st.caption(" · ".join(f"{stage}: {ms:.0f}" for stage, ms in result["timings"].items()))
+    elif uploaded_audio:
+        audio_path = AUDIO_TEMP.with_suffix(Path(uploaded_audio.name).suffix)
+        with open(audio_path, 'wb') as f:
             f.write(uploaded_audio.read())
         
-        transcription = process_audio_chunk(AUDIO_TEMP, prompt_input)
+        transcription = process_audio_chunk(audio_path, prompt_input)
         st.write(transcription)
 
 def main():
@@ -210,6 +320,7 @@ def main():
     # Sidebar for document upload
     with st.sidebar:
         st.header("Gerenciamento de Documentos")
+        st.text_input("Coleção", key="collection", help="Uploads e perguntas usam esta coleção")
         with st.form("upload-form", clear_on_submit=True):
             uploaded_files = st.file_uploader(
                 "Faça o Upload do seu PDF:",
@@ -219,12 +330,12 @@ def main():
             submit_button = st.form_submit_button("Processar")
             
             if submit_button and uploaded_files:
-                with st.spinner("Processando documentos..."):
-                    if upload_files(uploaded_files):
-                        st.session_state.uploaded_files = True
-                        st.success("Upload realizado com sucesso!", icon="✅")
-                    else:
-                        st.error("Erro ao processar documentos")
+                job_id = upload_files(uploaded_files)
+                if job_id and wait_for_job(job_id, st.progress(0.0), st.empty()):
+                    st.session_state.uploaded_files = True
+                    st.success("Upload realizado com sucesso!", icon="✅")
+                else:
+                    st.error("Erro ao processar documentos")
     
     # Main tabs
     tab1, tab2, tab3, tab4 = st.tabs([
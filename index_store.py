@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import pickle
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, NamedTuple, Optional
+
+import faiss
+
+from ann_index import IndexSettings, configure, index_mode
+from lexical import BM25Index, build_from_vectorstore, sync_with_vectorstore
+
+# The vectorstore module pulls in most of langchain_core; it is imported when
+# an index is first loaded rather than with this module
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+LEXICAL_DIR = "bm25"
+
+# Flat codes are mapped in place (IFC), IVF lists through the classic mmap
+# flag; IVF indexes reject the combination, so it is tried first and then the
+# classic flag alone.
+MMAP_FLAGS = (
+    getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    | faiss.IO_FLAG_MMAP
+    | faiss.IO_FLAG_READ_ONLY,
+    faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+)
+
+
+class IndexSnapshot(NamedTuple):
+    version: int
+    vectorstore: Optional["FAISS"]
+    lexical: Optional[BM25Index]
+
+
+class IndexStore:
+    """On-disk FAISS index plus docstore, shared by every worker.
+
+    Each publish writes a new ``vNNNNNN`` directory and then atomically
+    replaces ``manifest.json`` to point at it. Readers memory-map the
+    published index, so workers share the same pages, and hot-swap to a
+    newer version as soon as they notice the manifest changed. A BM25
+    index over the same chunks is kept in step and published with it.
+    """
+
+    def __init__(self, root: Path, embeddings, keep_versions: int = 2,
+                 index_settings: Optional[IndexSettings] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.embeddings = embeddings
+        self.keep_versions = keep_versions
+        self.index_settings = index_settings
+        self.version = 0
+        self.vectorstore: Optional["FAISS"] = None
+        self.lexical: Optional[BM25Index] = None
+        self._snapshot = IndexSnapshot(0, None, None)
+        self._manifest_mtime = None
+        self.resident_bytes = 0
+        self._swap_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.root / MANIFEST_NAME
+
+    def _read_manifest(self) -> Optional[dict]:
+        try:
+            with self.manifest_path.open("r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _version_dir(self, version: int) -> Path:
+        return self.root / f"v{version:06d}"
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists()
+
+    @property
+    def resident(self) -> bool:
+        return self._snapshot.vectorstore is not None
+
+    def disk_bytes(self, version: Optional[int] = None) -> int:
+        """Size of a published version (the current one by default) on disk."""
+        if version is None:
+            manifest = self._read_manifest()
+            if not manifest:
+                return 0
+            version = manifest["version"]
+        path = self._version_dir(version)
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) if path.exists() else 0
+
+    def _load_version(self, version: int, mmap: bool = True) -> "FAISS":
+        path = self._version_dir(version)
+        index_path = str(path / INDEX_FILE)
+        index = None
+        for flags in MMAP_FLAGS if mmap else ():
+            try:
+                index = faiss.read_index(index_path, flags)
+                break
+            except RuntimeError as e:
+                error = e
+        if index is None:
+            if mmap:
+                # Index types without mmap support are read into private memory
+                logger.warning(f"Memory-mapped load failed for {index_path}, reading into memory: {error}")
+            index = faiss.read_index(index_path)
+        if self.index_settings is not None:
+            configure(index, self.index_settings)
+        with (path / DOCSTORE_FILE).open("rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        from langchain_community.vectorstores import FAISS
+
+        return FAISS(self.embeddings, index, docstore, index_to_docstore_id)
+
+    def _load_lexical(self, version: int, vectorstore: "FAISS") -> BM25Index:
+        lexical = BM25Index.load(self._version_dir(version) / LEXICAL_DIR)
+        if lexical is None:
+            # Published before BM25 existed; index the chunks now
+            logger.info(f"Building BM25 index for version {version}")
+            lexical = build_from_vectorstore(vectorstore)
+        return lexical
+
+    def refresh(self) -> Optional["FAISS"]:
+        """Swap in a newer published index if the manifest changed."""
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return self.vectorstore
+        if mtime == self._manifest_mtime:
+            return self.vectorstore
+
+        with self._swap_lock:
+            if mtime == self._manifest_mtime:
+                return self.vectorstore
+            manifest = self._read_manifest()
+            if manifest and manifest["version"] > self.version:
+                vectorstore = self._load_version(manifest["version"])
+                lexical = self._load_lexical(manifest["version"], vectorstore)
+                self._snapshot = IndexSnapshot(manifest["version"], vectorstore, lexical)
+                self.version, self.vectorstore, self.lexical = self._snapshot
+                self.resident_bytes = self.disk_bytes(self.version)
+                logger.info(f"Loaded index version {self.version} ({manifest['num_vectors']} vectors)")
+            self._manifest_mtime = mtime
+        return self.vectorstore
+
+    def current(self) -> Optional["FAISS"]:
+        """Return the newest published index, or None if nothing was ingested yet."""
+        return self.refresh()
+
+    def snapshot(self) -> IndexSnapshot:
+        """Return the newest version, vector index and BM25 index as one consistent triple."""
+        self.refresh()
+        return self._snapshot
+
+    def unload(self):
+        """Drop the loaded index; the next read maps it from disk again.
+
+        Requests already holding a snapshot keep using it until they finish.
+        """
+        with self._swap_lock:
+            self._snapshot = IndexSnapshot(0, None, None)
+            self.version, self.vectorstore, self.lexical = self._snapshot
+            self._manifest_mtime = None
+            self.resident_bytes = 0
+
+    @contextmanager
+    def _exclusive(self):
+        with self._write_lock:
+            if fcntl is None:
+                yield
+                return
+            with (self.root / ".lock").open("a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update(self, mutate: Callable[[Optional["FAISS"]], "FAISS"]) -> "FAISS":
+        """Apply ``mutate`` to a private copy of the latest index and publish it.
+
+        Runs under a cross-process lock so concurrent writers never publish
+        on top of a stale version.
+        """
+        with self._exclusive():
+            manifest = self._read_manifest()
+            latest = manifest["version"] if manifest else 0
+            writable = self._load_version(latest, mmap=False) if latest else None
+            lexical = self._load_lexical(latest, writable) if latest else None
+            vectorstore = mutate(writable)
+            lexical = sync_with_vectorstore(lexical, vectorstore)
+            self._publish(vectorstore, lexical, latest + 1)
+        self.refresh()
+        return self.vectorstore
+
+    def _publish(self, vectorstore: "FAISS", lexical: BM25Index, version: int):
+        final_dir = self._version_dir(version)
+        tmp_dir = self.root / f".tmp-{version:06d}-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        faiss.write_index(vectorstore.index, str(tmp_dir / INDEX_FILE))
+        with (tmp_dir / DOCSTORE_FILE).open("wb") as f:
+            pickle.dump((vectorstore.docstore, vectorstore.index_to_docstore_id), f)
+            f.flush()
+            os.fsync(f.fileno())
+        lexical.save(tmp_dir / LEXICAL_DIR)
+        for path in [tmp_dir / INDEX_FILE, *(tmp_dir / LEXICAL_DIR).iterdir()]:
+            _fsync_file(path)
+        # Leftover from a publish that crashed before updating the manifest
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+
+        manifest = {
+            "version": version,
+            "path": final_dir.name,
+            "num_vectors": int(vectorstore.index.ntotal),
+            "dimension": int(vectorstore.index.d),
+            "index_mode": index_mode(vectorstore.index),
+            "created_at": time.time(),
+        }
+        tmp_manifest = self.root / f".{MANIFEST_NAME}.{os.getpid()}"
+        with tmp_manifest.open("w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_manifest, self.manifest_path)
+        logger.info(f"Published index version {version} ({manifest['num_vectors']} vectors)")
+        self._prune(version)
+
+    def _prune(self, version: int):
+        # Mapped files stay valid after unlink, so old versions can go right away
+        for old in range(version - self.keep_versions, 0, -1):
+            old_dir = self._version_dir(old)
+            if not old_dir.exists():
+                break
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _fsync_file(path: Path):
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
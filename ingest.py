@@ -0,0 +1,382 @@
+import os
+import time
+import pickle
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING, AsyncIterator, BinaryIO, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple,
+)
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from ann_index import remove_positions
+from metrics import CHUNKS, STAGE_SECONDS
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+logger = logging.getLogger(__name__)
+
+
+# PDF parsing and splitting happen in the parser pool's worker processes,
+# so their libraries are imported there rather than by the API process
+def make_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=512,
+        chunk_overlap=30,
+        length_function=len,
+        separators=["\n\n", "\n", ".", " "]
+    )
+
+
+def file_sha256(file_path: Path) -> str:
+    """Content hash used as the document ID."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_stream(source: BinaryIO, file_path: Path, block_size: int = 1 << 20) -> str:
+    """Copy a file object to disk a block at a time, hashing it on the way."""
+    digest = hashlib.sha256()
+    with open(file_path, "wb") as f:
+        for block in iter(lambda: source.read(block_size), b""):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+class UploadSpool(tempfile.SpooledTemporaryFile):
+    """Multipart upload buffer that is hashed as it is written and spills into ``directory``.
+
+    Parts over ``max_size`` roll over into a named file there rather than
+    an anonymous one, so ``save_upload`` renames the upload into place
+    instead of writing it to disk a second time. A spilled file that was
+    never saved is removed on close.
+    """
+
+    def __init__(self, max_size: int = 0, directory: Optional[Path] = None):
+        super().__init__(max_size=max_size, dir=directory)
+        self.directory = directory
+        self.digest = hashlib.sha256()
+        self._saved = False
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        return super().write(data)
+
+    def rollover(self):
+        if self._rolled:
+            return
+        buffer = self._file
+        self._file = tempfile.NamedTemporaryFile(dir=self.directory, prefix=".upload-", delete=False)
+        self._file.write(buffer.getbuffer())
+        self._file.seek(buffer.tell())
+        self._rolled = True
+
+    def save(self, file_path: Path) -> str:
+        """Move the upload to ``file_path``; returns its SHA-256."""
+        if self._rolled:
+            self._file.flush()
+            os.replace(self._file.name, file_path)
+            self._saved = True
+        else:
+            with open(file_path, "wb") as f:
+                f.write(self._file.getbuffer())
+        return self.digest.hexdigest()
+
+    def close(self):
+        leftover = self._file.name if self._rolled and not self._saved else None
+        super().close()
+        if leftover is not None:
+            Path(leftover).unlink(missing_ok=True)
+
+
+def save_upload(source: BinaryIO, file_path: Path) -> str:
+    """Save an uploaded file, hashing it; an ``UploadSpool`` is moved rather than copied."""
+    if isinstance(source, UploadSpool):
+        return source.save(file_path)
+    return save_stream(source, file_path)
+
+
+def has_document(vectorstore: Optional["FAISS"], doc_id: str) -> bool:
+    if vectorstore is None:
+        return False
+    return isinstance(vectorstore.docstore.search(f"{doc_id}:0"), Document)
+
+
+def count_pages(file_path: Path) -> int:
+    import pypdf
+
+    return len(pypdf.PdfReader(str(file_path)).pages)
+
+
+def load_page_range(file_path: Path, start: int, stop: int) -> List[Document]:
+    """Extract pages [start, stop) of a PDF as ``PyPDFLoader`` would (plain text, no images)."""
+    import pypdf
+    from langchain_community.document_loaders.parsers.pdf import _purge_metadata, _validate_metadata
+
+    reader = pypdf.PdfReader(str(file_path))
+    base_metadata = _purge_metadata(
+        {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+        | dict(reader.metadata or {})
+        | {"source": str(file_path), "total_pages": len(reader.pages)}
+    )
+    pages = []
+    for page_number in range(start, min(stop, len(reader.pages))):
+        page = reader.pages[page_number]
+        if pypdf.__version__.startswith("3"):
+            text = page.extract_text()
+        else:
+            text = page.extract_text(extraction_mode="plain")
+        pages.append(Document(
+            page_content=text.strip(),
+            metadata=_validate_metadata(base_metadata | {
+                "page": page_number,
+                "page_label": reader.page_labels[page_number],
+            }),
+        ))
+    return pages
+
+
+def parse_page_range(file_path: Path, start: int, stop: int) -> Tuple[List[Document], float, float]:
+    """Extract and split pages [start, stop) of a PDF.
+
+    Since the splitter works page by page, concatenating the ranges in
+    order yields exactly the chunks of ``PyPDFLoader.load_and_split``.
+    Also returns the seconds spent loading and splitting.
+    """
+    started = time.perf_counter()
+    pages = load_page_range(file_path, start, stop)
+    loaded = time.perf_counter()
+    chunks = make_splitter().split_documents(pages)
+    return chunks, loaded - started, time.perf_counter() - loaded
+
+
+class ChunkBatch(NamedTuple):
+    file_index: int
+    pages: int
+    chunks: List[Document]
+
+
+class PdfParserPool:
+    """Parse and split PDFs on a process pool, off the event loop.
+
+    Work is divided by file and, for PDFs longer than ``pages_per_task``,
+    by page range. Chunk batches come back in document and page order.
+    At most ``max_pending`` page ranges (default twice the workers) are
+    parsed ahead of the consumer, so a slow consumer holds back parsing
+    instead of letting parsed chunks pile up in memory.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, pages_per_task: int = 50,
+                 max_pending: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.max_pending = max_pending or 2 * self.max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def start(self):
+        """Start the workers now rather than on the first upload.
+
+        Forked workers inherit the import locks other threads hold at that
+        moment, so forking while a thread imports modules can deadlock
+        them; the API starts the pool before its background warm-up.
+        """
+        self.executor.submit(os.getpid).result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    async def stream(self, files: List[Tuple[Path, str, str]],
+                     on_page_counts: Optional[Callable[[List[int]], None]] = None) -> AsyncIterator[ChunkBatch]:
+        """Yield chunk batches in order for (path, doc_id, filename) files.
+
+        Chunks are tagged with their document and get positional IDs.
+        ``on_page_counts`` receives the page count of every file up front.
+        """
+        loop = asyncio.get_running_loop()
+        page_counts = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, count_pages, path) for path, _, _ in files
+        ))
+        if on_page_counts is not None:
+            on_page_counts(list(page_counts))
+        ranges = (
+            (file_index, path, start, min(self.pages_per_task, pages - start))
+            for file_index, ((path, _, _), pages) in enumerate(zip(files, page_counts))
+            for start in range(0, pages, self.pages_per_task)
+        )
+        tasks: Deque[Tuple[int, int, asyncio.Future]] = deque()
+
+        def submit():
+            for file_index, path, start, pages in ranges:
+                future = loop.run_in_executor(self.executor, parse_page_range, path, start, start + pages)
+                tasks.append((file_index, pages, future))
+                return
+
+        positions = [0] * len(files)
+        try:
+            for _ in range(self.max_pending):
+                submit()
+            while tasks:
+                file_index, pages, future = tasks.popleft()
+                chunks, load_seconds, split_seconds = await future
+                submit()
+                # Timed in the worker process, recorded here where /metrics is served
+                STAGE_SECONDS.observe(load_seconds, stage="pdf_load")
+                STAGE_SECONDS.observe(split_seconds, stage="split")
+                CHUNKS.inc(len(chunks), operation="parsed")
+                _, doc_id, filename = files[file_index]
+                for chunk in chunks:
+                    chunk.id = f"{doc_id}:{positions[file_index]}"
+                    chunk.metadata["doc_id"] = doc_id
+                    chunk.metadata["filename"] = filename
+                    positions[file_index] += 1
+                yield ChunkBatch(file_index, pages, chunks)
+        finally:
+            for _, _, future in tasks:
+                future.cancel()
+
+
+def document_registry(vectorstore: Optional["FAISS"]) -> Dict[str, dict]:
+    """Map doc_id -> filename and chunk count for everything in the index."""
+    registry: Dict[str, dict] = {}
+    if vectorstore is None:
+        return registry
+    for chunk_id in vectorstore.index_to_docstore_id.values():
+        doc_id = chunk_id.split(":", 1)[0]
+        entry = registry.get(doc_id)
+        if entry is None:
+            doc = vectorstore.docstore.search(chunk_id)
+            entry = registry[doc_id] = {
+                "doc_id": doc_id,
+                "filename": doc.metadata.get("filename", doc.metadata.get("source")),
+                "chunks": 0,
+            }
+        entry["chunks"] += 1
+    return registry
+
+
+def append_chunks(vectorstore: Optional["FAISS"], chunks: List[Document], vectors, embeddings) -> "FAISS":
+    """Append already-embedded chunks, creating the index on first ingest.
+
+    Does what ``FAISS.add_embeddings`` does, but hands ``vectors`` (any
+    float32 array, including a memory map) to FAISS without first copying
+    them into Python lists and a new array.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectorstore is None:
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+
+        vectorstore = FAISS(embeddings, faiss.IndexFlatL2(vectors.shape[1]), InMemoryDocstore(), {})
+    if vectorstore._normalize_L2:
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    start = vectorstore.index.ntotal
+    vectorstore.index.add(vectors)
+    vectorstore.docstore.add({chunk.id: chunk for chunk in chunks})
+    vectorstore.index_to_docstore_id.update({start + i: chunk.id for i, chunk in enumerate(chunks)})
+    return vectorstore
+
+
+class StagingSpool:
+    """Embedded chunks waiting to be published, kept on disk instead of in memory.
+
+    Vectors are appended to a raw float32 file and chunks to a pickle
+    stream; ``merge_staging`` reads them back a slice at a time.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.count = 0
+        self.dimension: Optional[int] = None
+        self.doc_ids = set()
+        self._vectors = open(self.directory / "vectors.f32", "wb")
+        self._chunks = open(self.directory / "chunks.pickle", "wb")
+
+    def append(self, chunks: List[Document], vectors: List[List[float]]):
+        array = np.asarray(vectors, dtype=np.float32)
+        self.dimension = array.shape[1]
+        self._vectors.write(array.tobytes())
+        for chunk in chunks:
+            pickle.dump(chunk, self._chunks, protocol=pickle.HIGHEST_PROTOCOL)
+            self.doc_ids.add(chunk.metadata["doc_id"])
+        self.count += len(chunks)
+
+    def slices(self, size: int) -> Iterator[Tuple[List[Document], np.ndarray]]:
+        """Spooled chunks in append order, ``size`` at a time, with their vectors memory-mapped."""
+        self._vectors.flush()
+        self._chunks.flush()
+        vectors = np.memmap(self.directory / "vectors.f32", dtype=np.float32, mode="r",
+                            shape=(self.count, self.dimension))
+        with open(self.directory / "chunks.pickle", "rb") as f:
+            for start in range(0, self.count, size):
+                stop = min(start + size, self.count)
+                yield [pickle.load(f) for _ in range(start, stop)], vectors[start:stop]
+
+    def close(self):
+        self._vectors.close()
+        self._chunks.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def merge_staging(vectorstore: Optional["FAISS"], staging: Optional[StagingSpool], embeddings,
+                  slice_size: int = 1024) -> Optional["FAISS"]:
+    """Fold newly embedded documents into the main index.
+
+    The spool is added ``slice_size`` chunks at a time, so beyond the index
+    itself only one slice of chunks and vectors is in memory at once.
+    """
+    if staging is None or not staging.count:
+        return vectorstore
+    # Another worker may have ingested the same documents in the meantime
+    skip = {doc_id for doc_id in staging.doc_ids if has_document(vectorstore, doc_id)}
+    for chunks, vectors in staging.slices(slice_size):
+        if skip:
+            keep = [i for i, chunk in enumerate(chunks) if chunk.metadata["doc_id"] not in skip]
+            if not keep:
+                continue
+            chunks, vectors = [chunks[i] for i in keep], vectors[keep]
+        vectorstore = append_chunks(vectorstore, chunks, vectors, embeddings)
+    return vectorstore
+
+
+def delete_document(vectorstore: "FAISS", doc_id: str) -> int:
+    """Remove every chunk of a document; returns how many were removed."""
+    prefix = f"{doc_id}:"
+    positions = [p for p, i in vectorstore.index_to_docstore_id.items() if i.startswith(prefix)]
+    if positions:
+        remove_chunks(vectorstore, positions)
+    return len(positions)
+
+
+def remove_chunks(vectorstore: "FAISS", positions: List[int]):
+    """``FAISS.delete`` for any index type: drop chunks and keep positions dense."""
+    removed = set(positions)
+    ids = [vectorstore.index_to_docstore_id[p] for p in positions]
+    vectorstore.index = remove_positions(vectorstore.index, positions)
+    vectorstore.docstore.delete(ids)
+    remaining = [i for p, i in sorted(vectorstore.index_to_docstore_id.items()) if p not in removed]
+    vectorstore.index_to_docstore_id = dict(enumerate(remaining))
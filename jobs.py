@@ -0,0 +1,154 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+
+@dataclass
+class IngestJob:
+    """Progress of one background ingestion."""
+    id: str
+    filenames: List[str]
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    pages_total: int = 0
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    documents: List[dict] = field(default_factory=list)
+    error: Optional[str] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "filenames": self.filenames,
+            "pages_total": self.pages_total,
+            "pages_parsed": self.pages_parsed,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "elapsed_seconds": round(elapsed, 3),
+            "pages_per_second": round(self.pages_parsed / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(self.chunks_embedded / elapsed, 2) if elapsed else 0.0,
+            "documents": self.documents,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Run ingestion jobs in the background with a cap on concurrent jobs.
+
+    Jobs beyond ``max_concurrent`` wait in the queued state, so ingestion
+    cannot take over the worker. Status snapshots are written to
+    ``status_dir`` so any worker can answer for a job it did not start.
+    """
+
+    def __init__(self, status_dir: Path, max_concurrent: int = 2, retention: int = 200):
+        self.status_dir = Path(status_dir)
+        self.status_dir.mkdir(parents=True, exist_ok=True)
+        self.retention = retention
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._last_snapshot = 0.0
+
+    def submit(self, filenames: List[str], runner: Callable[[IngestJob], Awaitable[List[dict]]],
+               cleanup: Optional[Callable[[], None]] = None) -> IngestJob:
+        job = IngestJob(id=uuid.uuid4().hex, filenames=filenames)
+        self._jobs[job.id] = job
+        self._trim()
+        job.task = asyncio.create_task(self._run(job, runner, cleanup))
+        self._snapshot(job)
+        logger.info(f"Queued ingestion job {job.id} for {len(filenames)} files")
+        return job
+
+    async def _run(self, job: IngestJob, runner, cleanup):
+        try:
+            async with self._slots:
+                job.status = RUNNING
+                job.started_at = time.time()
+                self._snapshot(job)
+                job.documents = await runner(job)
+                job.status = SUCCEEDED
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+            logger.info(f"Ingestion job {job.id} cancelled")
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+        finally:
+            job.finished_at = time.time()
+            if cleanup is not None:
+                cleanup()
+            self._snapshot(job)
+
+    def progress(self, job: IngestJob):
+        """Persist a progress snapshot, at most once per second."""
+        if job.id not in self._jobs:
+            return
+        now = time.monotonic()
+        if now - self._last_snapshot >= 1.0:
+            self._last_snapshot = now
+            self._snapshot(job)
+
+    def _snapshot(self, job: IngestJob):
+        path = self.status_dir / f"{job.id}.json"
+        tmp = path.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps(job.to_dict()))
+            tmp.replace(path)
+        except OSError as e:
+            logger.warning(f"Could not write status for job {job.id}: {e}")
+
+    def _trim(self):
+        while len(self._jobs) > self.retention:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status not in FINISHED:
+                break
+            del self._jobs[oldest_id]
+            (self.status_dir / f"{oldest_id}.json").unlink(missing_ok=True)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        path = self.status_dir / f"{job_id}.json"
+        if path.exists():
+            return json.loads(path.read_text())
+        return None
+
+    def list(self) -> List[dict]:
+        return [job.to_dict() for job in self._jobs.values()]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job owned by this worker; False if unknown or already finished."""
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED or job.task is None:
+            return False
+        job.task.cancel()
+        return True
+
+    async def wait(self, job_id: str) -> dict:
+        job = self._jobs[job_id]
+        if job.task is not None:
+            await asyncio.shield(job.task)
+        return job.to_dict()
@@ -0,0 +1,236 @@
+import re
+import json
+import logging
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and codes such as "12.345/2020", "abc-123" or "art. 5º" -> "5o"
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+(?:[-./][0-9a-z]+)*")
+
+STOPWORDS = frozenset("""
+a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles
+depois do dos e ela elas ele eles em entre era eram essa essas esse esses esta estas este estes
+eu foi foram ha isso isto ja lhe lhes mais mas me mesmo meu minha muito na nao nas nem no nos
+nossa nosso num numa o os ou para pela pelas pelo pelos por qual quando que quem se sem ser seu
+seus so sua suas tambem te tem tinha um uma umas uns voce voces
+""".split())
+
+# Plural endings, longest first (applied after accents are stripped)
+PLURALS = (
+    ("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"),
+    ("res", "r"), ("zes", "z"), ("ns", "m"), ("s", ""),
+)
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents, so "não" and "nao" match."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(word: str) -> str:
+    """Light Portuguese stemmer: folds plural and feminine forms together."""
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    for suffix, replacement in PLURALS:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)] + replacement
+            break
+    # Feminine to masculine: "obrigatória" and "obrigatórios" meet at "obrigatorio"
+    if word.endswith("a") and len(word) > 4:
+        word = word[:-1] + "o"
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Terms for BM25: stemmed words minus stopwords, plus codes kept whole.
+
+    A code like "abc-123" yields "abc-123", "abc123", "abc" and "123" so
+    it matches however the user types it.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(normalize(text)):
+        parts = re.split(r"[-./]", token)
+        if len(parts) > 1:
+            terms.append(token)
+            terms.append("".join(parts))
+            terms.extend(stem(part) for part in parts if part not in STOPWORDS)
+        elif token not in STOPWORDS:
+            terms.append(stem(token))
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over chunks, with postings in flat NumPy arrays.
+
+    Postings are stored CSR-style: the documents containing term ``t`` are
+    ``doc_ids[offsets[t]:offsets[t + 1]]`` with matching ``term_freqs``.
+    Documents are identified by their docstore (chunk) ID.
+    """
+
+    def __init__(self, terms: List[str], chunk_ids: List[str], offsets: np.ndarray, doc_ids: np.ndarray,
+                 term_freqs: np.ndarray, doc_lengths: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        self.terms = terms
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.chunk_ids = chunk_ids
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets.nbytes + self.doc_ids.nbytes + self.term_freqs.nbytes + self.doc_lengths.nbytes)
+
+    @classmethod
+    def empty(cls) -> "BM25Index":
+        return cls([], [], np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                   np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.int32))
+
+    @classmethod
+    def _from_triples(cls, terms: List[str], chunk_ids: List[str], term_index: np.ndarray,
+                      doc_index: np.ndarray, freqs: np.ndarray, doc_lengths: np.ndarray) -> "BM25Index":
+        order = np.lexsort((doc_index, term_index))
+        counts = np.bincount(term_index, minlength=len(terms))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(terms, chunk_ids, offsets, doc_index[order].astype(np.int32),
+                   np.minimum(freqs[order], np.iinfo(np.uint16).max).astype(np.uint16),
+                   doc_lengths.astype(np.int32))
+
+    @classmethod
+    def build(cls, chunk_ids: Sequence[str], texts: Iterable[str]) -> "BM25Index":
+        vocabulary: Dict[str, int] = {}
+        term_index, doc_index, freqs, doc_lengths = [], [], [], []
+        for doc, text in enumerate(texts):
+            counts: Dict[int, int] = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                term = vocabulary.setdefault(token, len(vocabulary))
+                counts[term] = counts.get(term, 0) + 1
+            term_index.extend(counts)
+            doc_index.extend([doc] * len(counts))
+            freqs.extend(counts.values())
+            doc_lengths.append(len(tokens))
+        return cls._from_triples(list(vocabulary), list(chunk_ids), np.asarray(term_index, dtype=np.int64),
+                                 np.asarray(doc_index, dtype=np.int64), np.asarray(freqs, dtype=np.int64),
+                                 np.asarray(doc_lengths, dtype=np.int64))
+
+    def _triples(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        term_index = np.repeat(np.arange(len(self.terms)), np.diff(self.offsets))
+        return term_index, self.doc_ids.astype(np.int64), self.term_freqs.astype(np.int64)
+
+    def merge(self, other: "BM25Index") -> "BM25Index":
+        """Return an index holding this index's chunks followed by ``other``'s."""
+        if not len(other):
+            return self
+        terms = list(self.terms)
+        vocabulary = dict(self.vocabulary)
+        remap = np.empty(len(other.terms), dtype=np.int64)
+        for i, term in enumerate(other.terms):
+            remap[i] = vocabulary.setdefault(term, len(terms))
+            if remap[i] == len(terms):
+                terms.append(term)
+        own_terms, own_docs, own_freqs = self._triples()
+        other_terms, other_docs, other_freqs = other._triples()
+        return self._from_triples(
+            terms, self.chunk_ids + other.chunk_ids,
+            np.concatenate((own_terms, remap[other_terms])),
+            np.concatenate((own_docs, other_docs + len(self))),
+            np.concatenate((own_freqs, other_freqs)),
+            np.concatenate((self.doc_lengths, other.doc_lengths)),
+        )
+
+    def remove(self, chunk_ids: Iterable[str]) -> "BM25Index":
+        """Return an index without the given chunks."""
+        removed = set(chunk_ids)
+        keep = np.fromiter((chunk_id not in removed for chunk_id in self.chunk_ids), dtype=bool,
+                           count=len(self.chunk_ids))
+        if keep.all():
+            return self
+        new_position = np.cumsum(keep) - 1
+        term_index, doc_index, freqs = self._triples()
+        kept = keep[doc_index]
+        # Drop terms that no longer occur anywhere
+        used, term_index = np.unique(term_index[kept], return_inverse=True)
+        return self._from_triples(
+            [self.terms[t] for t in used], [chunk_id for chunk_id, k in zip(self.chunk_ids, keep) if k],
+            term_index, new_position[doc_index[kept]], freqs[kept], self.doc_lengths[keep],
+        )
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float]]:
+        """Return up to ``k`` (chunk ID, BM25 score) pairs, best first."""
+        term_ids = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        if not term_ids or not len(self):
+            return []
+        scores = np.zeros(len(self), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_length, 1e-9))
+        for term in term_ids:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end].astype(np.float32)
+            idf = np.log(1 + (len(self) - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+        count = min(k, int(np.count_nonzero(scores)))
+        if count == 0:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunk_ids[i], float(scores[i])) for i in top]
+
+    def save(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ("offsets", "doc_ids", "term_freqs", "doc_lengths"):
+            np.save(directory / f"{name}.npy", getattr(self, name))
+        with (directory / "vocabulary.json").open("w", encoding="utf-8") as f:
+            json.dump({"terms": self.terms, "chunk_ids": self.chunk_ids}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["BM25Index"]:
+        """Load a saved index with its arrays memory-mapped; None if there is none."""
+        if not (directory / "vocabulary.json").exists():
+            return None
+        with (directory / "vocabulary.json").open("r", encoding="utf-8") as f:
+            names = json.load(f)
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode="r")
+                  for name in ("offsets", "doc_ids", "term_freqs", "doc_lengths")}
+        return cls(names["terms"], names["chunk_ids"], **arrays)
+
+
+def build_from_vectorstore(vectorstore) -> BM25Index:
+    """Index every chunk held by a FAISS vector store."""
+    if vectorstore is None:
+        return BM25Index.empty()
+    chunk_ids = list(vectorstore.index_to_docstore_id.values())
+    return BM25Index.build(chunk_ids, (vectorstore.docstore.search(i).page_content for i in chunk_ids))
+
+
+def sync_with_vectorstore(lexical: Optional[BM25Index], vectorstore) -> BM25Index:
+    """Bring a BM25 index in line with the chunks now in the vector store.
+
+    Only the difference is tokenized: removed chunks are dropped and new
+    ones indexed and merged in.
+    """
+    if lexical is None:
+        return build_from_vectorstore(vectorstore)
+    current = set(vectorstore.index_to_docstore_id.values()) if vectorstore is not None else set()
+    existing = set(lexical.chunk_ids)
+    lexical = lexical.remove(existing - current)
+    added = [chunk_id for chunk_id in vectorstore.index_to_docstore_id.values()
+             if chunk_id not in existing] if vectorstore is not None else []
+    if added:
+        lexical = lexical.merge(
+            BM25Index.build(added, (vectorstore.docstore.search(i).page_content for i in added))
+        )
+    return lexical
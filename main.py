@@ -1,29 +1,59 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette import formparsers
+from starlette.formparsers import MultiPartParser
+from pydantic import BaseModel, Field, model_validator
 import os
-import shutil
-from typing import List, Optional
+import json
+import time
+import base64
+import asyncio
+import uuid
+from typing import List, Literal, NamedTuple, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import uvicorn
 import logging
+from contextlib import asynccontextmanager
+from functools import lru_cache, partial
 from pathlib import Path
-from openai import OpenAI
-
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+
 from dotenv import load_dotenv
 
+from retrieval import RetrievalSettings, Retriever
+from context_builder import BuiltContext, ContextBuilder, ContextSettings
+from collection_manager import CollectionManager, CollectionNotFound, DEFAULT_COLLECTION
+from ann_index import IndexSettings
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from embedding_scheduler import EmbeddingScheduler, SchedulerSettings, estimate_tokens
+from providers import ProviderEmbeddings, Providers, ProviderSettings
+from audio_cache import AudioCache, CachedSpeech
+from tts import OpenAISpeech, SentenceBuffer, SPEECH_MEDIA_TYPES, STREAMABLE_FORMATS, split_sentences, stream_speech
+from semantic_cache import SemanticCache
+from vad import EnergyVAD, SPEECH_CONTINUE, SPEECH_START, UTTERANCE, pcm_to_wav
+from jobs import IngestJob, JobManager, SUCCEEDED
+from ingest import (
+    PdfParserPool, StagingSpool, UploadSpool, delete_document, document_registry, file_sha256, has_document,
+    merge_staging, save_upload,
+)
+from metrics import CHUNKS, CONTENT_TYPE, REGISTRY, TOKENS, Counter, MetricsMiddleware, timed
+from profiler import ProfilerMiddleware, find_profile
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up in the background, so the server is live at once and ready once warm."""
+    pdf_parser.start()
+    warmup = asyncio.create_task(warm_up())
+    yield
+    warmup.cancel()
+    await stop_workers()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -37,29 +67,79 @@ app.add_middleware(
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI()
-
-# Verify OpenAI API key is set
+# Checked when the clients are built at warm-up, which /readyz reports,
+# rather than failing the import
 if not os.getenv("OPENAI_API_KEY"):
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
+    logger.warning("OPENAI_API_KEY not found in environment variables")
 
 # Initialize global variables
 UPLOAD_DIR = Path("uploaded_pdfs")
-TEMP_DIR = Path("temp_audio")
+PERSIST_DIR = Path(os.getenv("PERSIST_DIRECTORY", "db"))
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-TEMP_DIR.mkdir(parents=True, exist_ok=True)
 
-# Store vectorstore in memory
-vectorstore = None
+# Per-route latency histograms, and opt-in sampling profiles of single
+# requests sent with an "X-Profile: 1" header
+PROFILES_DIR = PERSIST_DIR / "profiles"
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(
+    ProfilerMiddleware, directory=PROFILES_DIR, enabled=PROFILING_ENABLED,
+    interval=float(os.getenv("PROFILING_INTERVAL_MS", "10")) / 1000,
+    keep=int(os.getenv("PROFILING_KEEP", "50")),
+)
+
+# Uploads stay in memory up to this size, then spill to a temp file under
+# UPLOAD_DIR that is hashed as it is written and renamed into place when saved,
+# so a PDF is written to disk once
+MultiPartParser.spool_max_size = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(1024 * 1024)))
+INCOMING_DIR = UPLOAD_DIR / "incoming"
+INCOMING_DIR.mkdir(parents=True, exist_ok=True)
+for leftover in INCOMING_DIR.iterdir():
+    # Spilled by a worker that crashed mid-request
+    if leftover.stat().st_mtime < time.time() - 3600:
+        leftover.unlink(missing_ok=True)
+formparsers.SpooledTemporaryFile = partial(UploadSpool, directory=INCOMING_DIR)
+
+# Formats Whisper accepts directly, and its upload limit
+TRANSCRIPTION_FORMATS = ("flac", "m4a", "mp3", "mp4", "mpeg", "mpga", "oga", "ogg", "wav", "webm")
+TRANSCRIPTION_MAX_BYTES = 25 * 1024 * 1024
+
+RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", "100"))
+
+class QueryOptions(BaseModel):
+    collection: str = DEFAULT_COLLECTION
+    k: Optional[int] = Field(None, ge=1, le=RETRIEVAL_MAX_K)
+    use_mmr: Optional[bool] = None
+    score_threshold: Optional[float] = Field(None, ge=0, le=1)
+    # Hybrid retrieval: "rrf" or "linear" fusion of vector and BM25 results;
+    # lexical_weight=0 disables BM25
+    fusion: Optional[Literal["rrf", "linear"]] = None
+    vector_weight: Optional[float] = Field(None, ge=0)
+    lexical_weight: Optional[float] = Field(None, ge=0)
+    use_cache: bool = True
+
+    @model_validator(mode="after")
+    def check_settings(self):
+        # RetrievalSettings rejects combinations the field bounds cannot,
+        # such as both fusion weights at 0
+        self.retrieval_settings()
+        return self
+
+    def retrieval_settings(self) -> RetrievalSettings:
+        return retriever.settings.override(
+            k=self.k, use_mmr=self.use_mmr, score_threshold=self.score_threshold,
+            fusion=self.fusion, vector_weight=self.vector_weight, lexical_weight=self.lexical_weight,
+        )
 
-class Query(BaseModel):
+class Query(QueryOptions):
     question: str
 
-# [Previous functions remain the same: format_docs, load_prompt, save_upload_file, process_pdfs]
-def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
+class BatchQuery(QueryOptions):
+    questions: List[str]
+    # Send each answer as a Server-Sent Event as soon as it is ready
+    stream: bool = False
 
+# [Previous functions remain the same: load_prompt, save_upload_file, process_pdfs]
 def load_prompt():
     prompt = """É necessário responder à pergunta na frase, tal como no conteúdo do pdf.
     O contexto e a pergunta do utilizador são apresentados a seguir.
@@ -67,182 +147,1027 @@ def load_prompt():
     Pergunta = {question}
     Se a resposta não estiver no pdf, responda "Não consigo responder a essa pergunta com minha base de informações"
     """
+    from langchain_core.prompts import ChatPromptTemplate
+
     return ChatPromptTemplate.from_template(prompt)
 
-async def save_upload_file(upload_file: UploadFile) -> Path:
-    """Save an uploaded file and return its path."""
+# One pooled async client for every OpenAI call, with per-provider limits
+providers = Providers(ProviderSettings.from_env())
+
+# CPU-bound FAISS work (search, merges, writes) runs here, off the event loop
+faiss_pool = ThreadPoolExecutor(max_workers=int(os.getenv("FAISS_THREADS", "4")), thread_name_prefix="faiss")
+
+async def run_faiss(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(faiss_pool, partial(fn, *args))
+
+# Built once at startup and shared by every request
+embedding_cache = EmbeddingCache(
+    PERSIST_DIR / "embedding_cache.sqlite",
+    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000")),
+)
+# The LangChain OpenAI clients are slow to import, so they are built on first
+# use or by the startup warm-up
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+def openai_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+
+    # Chunks are at most 512 characters, so raw text is sent without tiktoken splitting
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL, http_async_client=providers.http_client, max_retries=0,
+                            check_embedding_ctx_length=False)
+
+# Document batches only go through the scheduler, which handles 429s itself
+provider_embeddings = ProviderEmbeddings(providers, openai_embeddings, model=EMBEDDING_MODEL,
+                                         retry_rate_limits=False)
+embeddings = CachedEmbeddings(provider_embeddings, embedding_cache)
+embedding_scheduler = EmbeddingScheduler(embeddings.aembed_documents, SchedulerSettings.from_env())
+
+@lru_cache(maxsize=None)
+def answer_chain():
+    from langchain_openai import ChatOpenAI
+    from langchain_core.output_parsers import StrOutputParser
+
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0,
+                     http_async_client=providers.http_client, max_retries=0)
+    return load_prompt() | llm | StrOutputParser()
+
+retriever = Retriever(RetrievalSettings.from_env())
+context_builder = ContextBuilder(ContextSettings.from_env())
+
+# Past answers per collection, matched by question similarity; reset whenever
+# that collection's index moves to a newer version
+answer_caches = {}
+
+def answer_cache(collection: str) -> SemanticCache:
+    cache = answer_caches.get(collection)
+    if cache is None:
+        cache = answer_caches.setdefault(collection, SemanticCache(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+            ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+        ))
+    return cache
+
+# PDF parsing and splitting run on a process pool, off the event loop, at
+# most PARSE_MAX_PENDING page ranges ahead of embedding
+pdf_parser = PdfParserPool(
+    max_workers=int(os.getenv("PARSE_WORKERS", "0")) or None,
+    pages_per_task=int(os.getenv("PARSE_PAGES_PER_TASK", "50")),
+    max_pending=int(os.getenv("PARSE_MAX_PENDING", "0")) or None,
+)
+
+# Background ingestion; a small cap keeps uploads from starving queries
+job_manager = JobManager(
+    PERSIST_DIR / "jobs",
+    max_concurrent=int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", "2")),
+)
+
+# Speech synthesis with a disk cache of (model, voice, speed, text); streamed
+# audio is cached per sentence
+audio_cache = AudioCache(
+    PERSIST_DIR / "tts_cache",
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+)
+speech = CachedSpeech(OpenAISpeech(providers, model="tts-1"), audio_cache)
+TTS_MAX_PARALLEL = int(os.getenv("TTS_MAX_PARALLEL", "3"))
+
+# Persisted, memory-mapped indexes shared by every worker, one per collection;
+# the least recently used are unloaded past the memory budget, and each index
+# switches to an approximate (IVF/PQ) type as its collection grows
+collection_manager = CollectionManager(
+    PERSIST_DIR, embeddings,
+    memory_budget=int(float(os.getenv("COLLECTIONS_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024),
+    index_settings=IndexSettings.from_env(),
+)
+
+# Collections whose indexes are loaded at startup, before /readyz reports ready
+PRELOAD_COLLECTIONS = [name for name in os.getenv("PRELOAD_COLLECTIONS", DEFAULT_COLLECTION).split(",") if name]
+# Also open a provider connection (a model list request) during warm-up
+WARMUP_CONNECT = os.getenv("WARMUP_CONNECT", "true").lower() == "true"
+
+# A failed warm-up is retried with capped exponential backoff; after
+# WARMUP_MAX_ATTEMPTS it gives up and /healthz fails, so the process is restarted
+WARMUP_MAX_ATTEMPTS = int(os.getenv("WARMUP_MAX_ATTEMPTS", "5"))
+WARMUP_MAX_BACKOFF = float(os.getenv("WARMUP_MAX_BACKOFF", "60"))
+
+# Warm-up state, as reported by /readyz: "starting", "ready" or "failed"
+readiness = {"status": "starting", "detail": None, "seconds": None, "attempts": 0}
+
+def preload_collection(collection: str):
     try:
-        file_path = UPLOAD_DIR / upload_file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(upload_file.file, buffer)
-        return file_path
+        snapshot = collection_manager.snapshot(collection)
+    except CollectionNotFound:
+        logger.warning(f"Collection to preload not found: {collection}")
+        return
+    if snapshot.vectorstore is not None:
+        logger.info(f"Warm start of {collection} from index version {snapshot.version}")
+
+def build_clients():
+    """Import and build the OpenAI clients and load the context tokenizer."""
+    provider_embeddings.underlying  # built on first access
+    answer_chain()
+    context_builder.count_tokens("")
+
+async def warm_up_once():
+    # One step at a time: LangChain's lazy imports are not safe to run
+    # from two threads at once
+    await asyncio.to_thread(build_clients)
+    for collection in PRELOAD_COLLECTIONS:
+        await run_faiss(preload_collection, collection)
+    if WARMUP_CONNECT:
+        try:
+            await providers.connect()
+        except Exception as e:
+            logger.warning(f"Could not open a provider connection during warm-up: {str(e)}")
+
+async def warm_up():
+    """Do the work the first requests would otherwise wait for, then report ready."""
+    started = time.perf_counter()
+    for attempt in range(1, WARMUP_MAX_ATTEMPTS + 1):
+        readiness["attempts"] = attempt
+        try:
+            await warm_up_once()
+        except Exception as e:
+            logger.error(f"Error in warm_up (attempt {attempt}/{WARMUP_MAX_ATTEMPTS}): {str(e)}")
+            readiness["detail"] = str(e)
+            if attempt < WARMUP_MAX_ATTEMPTS:
+                await asyncio.sleep(min(WARMUP_MAX_BACKOFF, 2 ** (attempt - 1)))
+            continue
+        readiness.update(status="ready", detail=None, seconds=round(time.perf_counter() - started, 3))
+        logger.info(f"Ready after a {readiness['seconds']}s warm-up")
+        return
+    readiness["status"] = "failed"
+
+def check_collection(collection: str) -> str:
+    try:
+        return CollectionManager.validate(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def collection_snapshot(collection: str):
+    """Load (or reuse) a collection's index; 404 if it does not exist."""
+    check_collection(collection)
+    try:
+        return await run_faiss(collection_manager.snapshot, collection)
+    except CollectionNotFound:
+        raise HTTPException(status_code=404, detail=f"Collection {collection} not found")
+
+async def stop_workers():
+    pdf_parser.shutdown()
+    faiss_pool.shutdown(wait=False)
+    collection_manager.shutdown()
+    await providers.aclose()
+
+async def save_upload_file(upload_file: UploadFile, directory: Path = UPLOAD_DIR) -> Tuple[Path, str]:
+    """Move an uploaded file into ``directory``; returns its path and SHA-256."""
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        file_path = directory / Path(upload_file.filename).name
+        digest = await asyncio.to_thread(save_upload, upload_file.file, file_path)
+        return file_path, digest
     except Exception as e:
         logger.error(f"Error saving file {upload_file.filename}: {str(e)}")
         raise
 
-def process_pdfs(file_paths: List[Path]):
-    """Process PDF files and create vectorstore."""
+async def process_pdfs(file_paths: List[Path], collection: str = DEFAULT_COLLECTION,
+                       replace_doc_id: Optional[str] = None, job: Optional[IngestJob] = None,
+                       doc_ids: Optional[List[str]] = None) -> List[dict]:
+    """Embed new PDFs and append them to a collection's persisted index.
+
+    Files whose content hash is already indexed are skipped without being
+    parsed or embedded; ``doc_ids`` are their hashes when already known.
+    ``replace_doc_id`` is removed in the same publish. Progress is
+    recorded on ``job`` when one is given.
+
+    Pages flow through as a stream: parsed page ranges, chunks, embedding
+    batches, then a staging spool on disk. Each step holds back the one
+    before it, so memory stays bounded whatever the size of the PDFs.
+    """
+    job = job or IngestJob(id="inline", filenames=[path.name for path in file_paths])
+    staging = None
     try:
-        text_chunks = []
-        for file_path in file_paths:
+        current = (await run_faiss(collection_manager.snapshot, collection, True)).vectorstore
+        results = []
+        pending = []
+        for i, file_path in enumerate(file_paths):
+            doc_id = doc_ids[i] if doc_ids else await asyncio.to_thread(file_sha256, file_path)
+            if has_document(current, doc_id) or any(r["doc_id"] == doc_id for r in results):
+                logger.info(f"Skipping already indexed PDF: {file_path} ({doc_id})")
+                results.append({"doc_id": doc_id, "filename": file_path.name, "status": "unchanged"})
+                continue
+
             logger.info(f"Processing PDF: {file_path}")
-            loader = PyPDFLoader(str(file_path))
-            chunks = loader.load_and_split(
-                text_splitter=RecursiveCharacterTextSplitter(
-                    chunk_size=512,
-                    chunk_overlap=30,
-                    length_function=len,
-                    separators=["\n\n", "\n", ".", " "]
-                )
-            )
-            text_chunks.extend(chunks)
-            logger.info(f"Extracted {len(chunks)} chunks from {file_path}")
-        
-        if not text_chunks:
+            pending.append((file_path, doc_id, file_path.name))
+            results.append({"doc_id": doc_id, "filename": file_path.name, "status": "indexed", "chunks": 0})
+
+        indexed = [r for r in results if r["status"] == "indexed"]
+        replace_doc_id = replace_doc_id if replace_doc_id not in {r["doc_id"] for r in results} else None
+        if not pending and not replace_doc_id:
+            return results
+
+        def on_page_counts(page_counts):
+            job.pages_total = sum(page_counts)
+
+        # Chunks that are parsed but not yet embedded, by stream position
+        unembedded = {}
+
+        async def chunk_texts():
+            position = 0
+            async for batch in pdf_parser.stream(pending, on_page_counts):
+                indexed[batch.file_index]["chunks"] += len(batch.chunks)
+                job.pages_parsed += batch.pages
+                job.chunks_total += len(batch.chunks)
+                job_manager.progress(job)
+                for chunk in batch.chunks:
+                    unembedded[position] = chunk
+                    position += 1
+                    yield chunk.page_content
+
+        # Embed outside the index lock, spooling finished batches to disk
+        staging = StagingSpool(UPLOAD_DIR / "staging" / uuid.uuid4().hex)
+        async for offset, vectors in embedding_scheduler.stream_from(chunk_texts()):
+            chunks = [unembedded.pop(offset + i) for i in range(len(vectors))]
+            with timed("index_add"):
+                await run_faiss(staging.append, chunks, vectors)
+            CHUNKS.inc(len(vectors), operation="embedded")
+            job.chunks_embedded += len(vectors)
+            job_manager.progress(job)
+        for result in indexed:
+            logger.info(f"Extracted {result['chunks']} chunks from {result['filename']}")
+        if pending and not staging.count:
             raise ValueError("No text chunks extracted from PDFs")
-        
-        embeddings = OpenAIEmbeddings()
-        return FAISS.from_documents(documents=text_chunks, embedding=embeddings)
+        logger.info(f"Embedded {staging.count} chunks")
+
+        def apply(vectorstore):
+            if replace_doc_id and vectorstore is not None:
+                delete_document(vectorstore, replace_doc_id)
+            return merge_staging(vectorstore, staging, embeddings)
+
+        # The publish runs on a FAISS thread that cannot be interrupted, so once
+        # it has started a cancellation waits for it: the job then reports what
+        # actually happened, and the spool is not closed while it is being read
+        publish = asyncio.ensure_future(run_faiss(collection_manager.update, collection, apply))
+        with timed("index_publish"):
+            while not publish.done():
+                try:
+                    await asyncio.shield(publish)
+                except asyncio.CancelledError:
+                    logger.info(f"Cancellation of job {job.id} arrived during the publish; finishing it")
+            publish.result()
+        CHUNKS.inc(staging.count, operation="indexed")
+        return results
     except Exception as e:
         logger.error(f"Error processing PDFs: {str(e)}")
         raise
+    finally:
+        if staging is not None:
+            await asyncio.to_thread(staging.close)
 
-# [Previous endpoints remain the same: upload_files, query_documents]
-@app.post("/upload")
-async def upload_files(files: List[UploadFile] = File(...)):
-    global vectorstore
+def remove_files(paths: List[Path]):
+    for file_path in paths:
+        if file_path.exists():
+            file_path.unlink()
+            logger.info(f"Cleaned up file: {file_path}")
+    for directory in {file_path.parent for file_path in paths}:
+        if directory != UPLOAD_DIR and directory.exists() and not any(directory.iterdir()):
+            directory.rmdir()
+
+async def start_ingest_job(files: List[UploadFile], collection: str = DEFAULT_COLLECTION,
+                           replace_doc_id: Optional[str] = None, wait: bool = False):
+    """Save uploads and hand them to a background ingestion job."""
     saved_files = []
-    
+    doc_ids = []
     try:
-        # Validate files
+        # Each request gets its own directory so equal filenames never collide
+        job_dir = UPLOAD_DIR / uuid.uuid4().hex
         for file in files:
-            if not file.filename.lower().endswith('.pdf'):
-                raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-        
-        # Save files
-        for file in files:
-            file_path = await save_upload_file(file)
+            file_path, doc_id = await save_upload_file(file, job_dir)
             saved_files.append(file_path)
+            doc_ids.append(doc_id)
             logger.info(f"Saved file: {file_path}")
-        
-        # Process PDFs
-        vectorstore = process_pdfs(saved_files)
-        logger.info("Vectorstore created successfully")
-        
-        # Cleanup
-        for file_path in saved_files:
-            file_path.unlink()
-            logger.info(f"Cleaned up file: {file_path}")
-        
-        return {"message": "Files processed successfully"}
-    
     except Exception as e:
-        logger.error(f"Error in upload_files: {str(e)}")
-        # Cleanup on error
-        for file_path in saved_files:
-            if file_path.exists():
-                file_path.unlink()
-                logger.info(f"Cleaned up file on error: {file_path}")
-        
-        if isinstance(e, HTTPException):
-            raise e
+        logger.error(f"Error saving uploads: {str(e)}")
+        remove_files(saved_files)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/query")
-async def query_documents(query: Query):
-    if not vectorstore:
+    job = job_manager.submit(
+        [path.name for path in saved_files],
+        lambda job: process_pdfs(saved_files, collection, replace_doc_id=replace_doc_id, job=job, doc_ids=doc_ids),
+        cleanup=lambda: remove_files(saved_files),
+    )
+    if wait:
+        status = await job_manager.wait(job.id)
+        if status["status"] != SUCCEEDED:
+            raise HTTPException(status_code=500, detail=status["error"] or status["status"])
+        return status
+    return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status})
+
+@app.post("/upload")
+async def upload_files(files: List[UploadFile] = File(...), wait: bool = False,
+                       collection: str = DEFAULT_COLLECTION):
+    """Accept PDFs and ingest them in the background; returns a job ID.
+
+    The collection is created on its first upload. Pass ``wait=true`` to
+    block until ingestion finishes.
+    """
+    check_collection(collection)
+    for file in files:
+        if not file.filename.lower().endswith('.pdf'):
+            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    return await start_ingest_job(files, collection, wait=wait)
+
+@app.get("/jobs")
+async def list_jobs():
+    return {"jobs": job_manager.list()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report pages parsed, chunks embedded and throughput for a job."""
+    status = job_manager.get(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return status
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found or already finished")
+    return {"job_id": job_id, "status": "cancelling"}
+
+@app.get("/collections")
+async def list_collections():
+    """Per-collection size, residency and last access, plus the memory budget."""
+    return await run_faiss(collection_manager.stats)
+
+@app.get("/collections/{collection}")
+async def get_collection(collection: str):
+    check_collection(collection)
+    try:
+        return await run_faiss(collection_manager.describe, collection)
+    except CollectionNotFound:
+        raise HTTPException(status_code=404, detail=f"Collection {collection} not found")
+
+@app.get("/documents")
+async def list_documents(collection: str = DEFAULT_COLLECTION):
+    """List a collection's indexed documents with their chunk counts."""
+    snapshot = await collection_snapshot(collection)
+    registry = document_registry(snapshot.vectorstore)
+    return {"documents": list(registry.values()), "version": snapshot.version}
+
+@app.delete("/documents/{doc_id}")
+async def remove_document(doc_id: str, collection: str = DEFAULT_COLLECTION):
+    """Delete every chunk of a document from the index."""
+    if not has_document((await collection_snapshot(collection)).vectorstore, doc_id):
+        raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
+    try:
+        removed = 0
+
+        def apply(vectorstore):
+            nonlocal removed
+            if vectorstore is not None:
+                removed = delete_document(vectorstore, doc_id)
+            return vectorstore
+
+        await run_faiss(collection_manager.update, collection, apply)
+        logger.info(f"Deleted document {doc_id} ({removed} chunks)")
+        return {"doc_id": doc_id, "deleted_chunks": removed}
+    except Exception as e:
+        logger.error(f"Error in remove_document: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/documents/{doc_id}")
+async def replace_document(doc_id: str, file: UploadFile = File(...), wait: bool = False,
+                           collection: str = DEFAULT_COLLECTION):
+    """Replace a document with a new version of the PDF (as a background job)."""
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    if not has_document((await collection_snapshot(collection)).vectorstore, doc_id):
+        raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
+    return await start_ingest_job([file], collection, replace_doc_id=doc_id, wait=wait)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the shared caches."""
+    return {
+        "embeddings": embedding_cache.stats(),
+        "tts": audio_cache.stats(),
+        "answers": {collection: cache.stats() for collection, cache in answer_caches.items()},
+    }
+
+def cache_metrics():
+    """Hit/miss counters of the caches, read at scrape time."""
+    hits = Counter("rag_cache_hits_total", "Cache lookups that were served from the cache", ["cache"])
+    misses = Counter("rag_cache_misses_total", "Cache lookups that missed", ["cache"])
+    caches = [("embeddings", embedding_cache.stats()), ("tts", audio_cache.stats()),
+              *((f"answers:{collection}", cache.stats()) for collection, cache in list(answer_caches.items()))]
+    for name, stats in caches:
+        hits.inc(stats["hits"], cache=name)
+        misses.inc(stats["misses"], cache=name)
+    return [hits, misses]
+
+REGISTRY.register_collector(cache_metrics)
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests; 503 once the warm-up has given up."""
+    if readiness["status"] == "failed":
+        return JSONResponse({"status": "failed", "detail": readiness["detail"]}, status_code=503)
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once indexes are preloaded and clients built, 503 until then."""
+    return JSONResponse(readiness, status_code=200 if readiness["status"] == "ready" else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics of this worker process: stage latencies, tokens, chunks, cache hits."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """Folded stacks of a profiled request (see the X-Profile-Id response header)."""
+    path = find_profile(PROFILES_DIR, profile_id) if PROFILING_ENABLED else None
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return FileResponse(str(path), media_type="text/plain")
+
+class QueryContext(NamedTuple):
+    collection: str
+    vectorstore: object
+    lexical: object
+    version: int
+    settings: RetrievalSettings
+    question: str
+    query_vector: List[float]
+
+async def prepare_query(query: Query) -> Tuple[QueryContext, Optional[dict]]:
+    """Embed the question once and check the semantic answer cache."""
+    snapshot = await collection_snapshot(query.collection)
+    vectorstore = snapshot.vectorstore
+    if not vectorstore or vectorstore.index.ntotal == 0:
         raise HTTPException(status_code=400, detail="No documents have been uploaded yet")
-    
+    settings = query.retrieval_settings()
+    context = QueryContext(query.collection, vectorstore, snapshot.lexical, snapshot.version, settings, query.question,
+                           await vectorstore.embeddings.aembed_query(query.question))
+    cached = None
+    if query.use_cache:
+        cached = await run_faiss(answer_cache(query.collection).lookup, context.query_vector, context.version, repr(settings))
+        if cached is not None:
+            logger.info(f"Semantic cache hit ({cached['similarity']:.3f}) for: {query.question}")
+    return context, cached
+
+async def retrieve_for(context: QueryContext):
+    """Search the loaded index directly; stored chunks are never re-embedded."""
+    with timed("index_search"):
+        hits = await run_faiss(retriever.retrieve_by_vector, context.vectorstore, context.query_vector,
+                               context.settings, context.lexical, context.question)
+    CHUNKS.inc(len(hits), operation="retrieved")
+    return hits
+
+def build_context(hits) -> BuiltContext:
+    """Merge, deduplicate and pack the retrieved chunks into the prompt's token budget."""
+    with timed("prompt"):
+        return context_builder.build(hits)
+
+def answer_inputs(context: BuiltContext, question: str) -> dict:
+    """Prompt variables for the answer chain; counts the prompt's tokens and those the builder saved."""
+    TOKENS.inc(context.tokens + context_builder.count_tokens(question), kind="prompt")
+    TOKENS.inc(context.saved_tokens, kind="saved")
+    return {"context": context.text, "question": question}
+
+def context_stats(context: BuiltContext) -> dict:
+    return {"tokens": context.tokens, "tokens_saved": context.saved_tokens,
+            "chunks": context.chunks, "passages": context.passages}
+
+def remember_answer(query: Query, context: QueryContext, response: str, sources: List[dict], stats: dict):
+    """Cache the answer with its sources and context stats, so a hit can return what a miss did."""
+    if query.use_cache:
+        answer_cache(context.collection).store(context.query_vector, context.version, repr(context.settings),
+                             query.question, response, sources, stats)
+
+def source_metadata(hits) -> List[dict]:
+    return [
+        {
+            "doc_id": doc.metadata.get("doc_id"),
+            "filename": doc.metadata.get("filename"),
+            "page": doc.metadata.get("page"),
+            "score": round(score, 4),
+        }
+        for doc, score in hits
+    ]
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/query")
+async def query_documents(query: Query, http_response: Response):
+    context, cached = await prepare_query(query)
+    if cached is not None:
+        http_response.headers["X-Cache"] = "HIT"
+        return {"response": cached["response"], "context": cached["context"]}
+    http_response.headers["X-Cache"] = "MISS"
+
     try:
+        hits = await retrieve_for(context)
         logger.info(f"Processing query: {query.question}")
-        
-        # Create similarity search
-        similar_embeddings = vectorstore.similarity_search(query.question)
-        similar_store = FAISS.from_documents(documents=similar_embeddings, embedding=OpenAIEmbeddings())
-        
-        # Set up RAG chain
-        retriever = similar_store.as_retriever()
-        llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
-        prompt = load_prompt()
-        
-        rag_chain = (
-            {"context": retriever | format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | llm
-            | StrOutputParser()
-        )
-        
+        prompt_context = build_context(hits)
+        logger.info(f"Context: {context_stats(prompt_context)}")
+
         # Get response
-        response = rag_chain.invoke(query.question)
+        inputs = answer_inputs(prompt_context, query.question)
+        response = await providers.call("chat", lambda: answer_chain().ainvoke(inputs))
+        TOKENS.inc(estimate_tokens(response), kind="completion")
+        remember_answer(query, context, response, source_metadata(hits), context_stats(prompt_context))
         logger.info("Query processed successfully")
-        return {"response": response}
+        return {"response": response, "context": context_stats(prompt_context)}
     
     except Exception as e:
         logger.error(f"Error in query_documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/stream")
+async def query_documents_stream(query: Query):
+    """Stream the answer as Server-Sent Events.
+
+    Events: ``sources`` (retrieved chunk metadata, sent first), one ``token``
+    per LLM delta, then ``done`` with the full answer, or ``error``.
+    A semantic cache hit sends the stored answer as a single token.
+    """
+    context, cached = await prepare_query(query)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+               "X-Cache": "HIT" if cached is not None else "MISS"}
+
+    if cached is not None:
+        async def cached_events():
+            yield sse_event("sources", cached["sources"])
+            yield sse_event("token", {"token": cached["response"]})
+            yield sse_event("done", {"response": cached["response"], "context": cached["context"]})
+
+        return StreamingResponse(cached_events(), media_type="text/event-stream", headers=headers)
+
+    try:
+        hits = await retrieve_for(context)
+    except Exception as e:
+        logger.error(f"Error in query_documents_stream: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    logger.info(f"Streaming query: {query.question}")
+    sources = source_metadata(hits)
+
+    async def events():
+        yield sse_event("sources", sources)
+        answer = []
+        try:
+            prompt_context = build_context(hits)
+            inputs = answer_inputs(prompt_context, query.question)
+            async for token in providers.stream("chat", lambda: answer_chain().astream(inputs)):
+                if token:
+                    answer.append(token)
+                    yield sse_event("token", {"token": token})
+            response = "".join(answer)
+            TOKENS.inc(estimate_tokens(response), kind="completion")
+            remember_answer(query, context, response, sources, context_stats(prompt_context))
+            yield sse_event("done", {"response": response, "context": context_stats(prompt_context)})
+            logger.info("Streaming query completed successfully")
+        except Exception as e:
+            logger.error(f"Error in query_documents_stream: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+@app.post("/query/batch")
+async def query_batch(batch: BatchQuery):
+    """Answer many questions with batched embedding and a single index search.
+
+    Identical questions are answered once, and questions that retrieve the
+    same chunks share one built context. Answers are generated at most
+    ``BATCH_CONCURRENCY`` at a time. Returns ``results`` in question order
+    plus ``stats``; with ``stream`` set, each result is sent as a ``result``
+    Server-Sent Event as soon as it is ready, then ``done`` with the stats.
+    A failed question gets an ``error`` instead of a ``response``.
+    """
+    if not batch.questions:
+        raise HTTPException(status_code=400, detail="questions is empty")
+    if len(batch.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    snapshot = await collection_snapshot(batch.collection)
+    vectorstore = snapshot.vectorstore
+    if not vectorstore or vectorstore.index.ntotal == 0:
+        raise HTTPException(status_code=400, detail="No documents have been uploaded yet")
+    settings = batch.retrieval_settings()
+    cache = answer_cache(batch.collection)
+
+    questions = list(dict.fromkeys(batch.questions))
+    try:
+        # Token-budgeted embedding batches: one request for typical batch sizes
+        vectors = await embedding_scheduler.embed_all(questions)
+        cached = [None] * len(questions)
+        if batch.use_cache:
+            cached = await run_faiss(lambda: [cache.lookup(vector, snapshot.version, repr(settings))
+                                              for vector in vectors])
+        misses = [i for i, hit in enumerate(cached) if hit is None]
+        hits = [None] * len(questions)
+        if misses:
+            with timed("index_search"):
+                found = await run_faiss(retriever.retrieve_by_vectors, vectorstore, [vectors[i] for i in misses],
+                                        settings, snapshot.lexical, [questions[i] for i in misses])
+            for i, question_hits in zip(misses, found):
+                hits[i] = question_hits
+                CHUNKS.inc(len(question_hits), operation="retrieved")
+    except Exception as e:
+        logger.error(f"Error in query_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Questions that retrieved the same chunks share one built context
+    contexts = {}
+    for question_hits in hits:
+        if question_hits is not None:
+            key = tuple(doc.id for doc, _ in question_hits)
+            if key not in contexts:
+                contexts[key] = build_context(question_hits)
+    gate = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def answer(i: int) -> dict:
+        if cached[i] is not None:
+            return {"response": cached[i]["response"], "sources": cached[i]["sources"],
+                    "context": cached[i]["context"], "cached": True}
+        sources = source_metadata(hits[i])
+        prompt_context = contexts[tuple(doc.id for doc, _ in hits[i])]
+        inputs = answer_inputs(prompt_context, questions[i])
+        async with gate:
+            response = await providers.call("chat", lambda: answer_chain().ainvoke(inputs))
+        TOKENS.inc(estimate_tokens(response), kind="completion")
+        if batch.use_cache:
+            cache.store(vectors[i], snapshot.version, repr(settings), questions[i], response, sources,
+                        context_stats(prompt_context))
+        return {"response": response, "sources": sources, "context": context_stats(prompt_context), "cached": False}
+
+    async def settle(i: int) -> Tuple[int, dict]:
+        try:
+            return i, await answer(i)
+        except Exception as e:
+            logger.error(f"Error in query_batch: {str(e)}")
+            return i, {"error": str(e)}
+
+    positions = {}
+    for index, question in enumerate(batch.questions):
+        positions.setdefault(question, []).append(index)
+    stats = {
+        "questions": len(batch.questions),
+        "unique_questions": len(questions),
+        "unique_contexts": len(contexts),
+        "cache_hits": len(questions) - len(misses),
+    }
+    logger.info(f"Batch query: {stats}")
+
+    def results_for(i: int, result: dict) -> List[dict]:
+        return [{"index": index, "question": questions[i], **result} for index in positions[questions[i]]]
+
+    if not batch.stream:
+        settled = await asyncio.gather(*(settle(i) for i in range(len(questions))))
+        results = sorted((r for i, result in settled for r in results_for(i, result)), key=lambda r: r["index"])
+        stats["errors"] = sum(1 for result in results if "error" in result)
+        return {"results": results, "stats": stats}
+
+    async def events():
+        tasks = [asyncio.create_task(settle(i)) for i in range(len(questions))]
+        errors = 0
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                i, result = await next_result
+                for item in results_for(i, result):
+                    errors += "error" in item
+                    yield sse_event("result", item)
+            yield sse_event("done", {**stats, "errors": errors})
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # New audio endpoints
 @app.post("/text-to-audio")
-async def text_to_audio(input_text: str = Form(...), voice: Optional[str] = Form("alloy")):
+async def text_to_audio(input_text: str = Form(...), voice: Optional[str] = Form("alloy"),
+                        response_format: str = Form("mp3")):
     """Convert text to audio using OpenAI's TTS API."""
+    if response_format not in SPEECH_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"response_format must be one of {list(SPEECH_MEDIA_TYPES)}")
+    media_type = SPEECH_MEDIA_TYPES[response_format]
     try:
         logger.info(f"Converting text to audio with voice: {voice}")
-        response = client.audio.speech.create(
-            model="tts-1",
-            voice=voice,
-            input=input_text,
-            speed=1.0
-        )
+        path, audio = await speech.fetch(input_text, voice=voice, speed=1.0, response_format=response_format)
         
-        output_path = TEMP_DIR / "output_audio.mp3"
-        response.stream_to_file(str(output_path))
-        
-        logger.info("Audio file created successfully")
-        return FileResponse(str(output_path), media_type="audio/mp3")
+        logger.info("Audio file ready")
+        # Freshly synthesized audio is sent from memory; cache hits are served from a
+        # private link to the cached file, which eviction cannot remove mid-response
+        if audio is not None:
+            return Response(content=audio, media_type=media_type)
+        return FileResponse(str(path), media_type=media_type,
+                            background=BackgroundTask(path.unlink, missing_ok=True))
     except Exception as e:
         logger.error(f"Error in text_to_audio: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/text-to-audio/stream")
+async def text_to_audio_stream(input_text: str = Form(...), voice: Optional[str] = Form("alloy"),
+                               response_format: str = Form("mp3")):
+    """Stream speech sentence by sentence as a chunked audio response.
+
+    Sentences are synthesized concurrently and sent in order; the first
+    bytes go out as soon as the first sentence is ready.
+    """
+    if response_format not in STREAMABLE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"response_format must be one of {list(STREAMABLE_FORMATS)}")
+    sentences = split_sentences(input_text)
+    if not sentences:
+        raise HTTPException(status_code=400, detail="input_text is empty")
+    logger.info(f"Streaming {len(sentences)} sentences to audio with voice: {voice}")
+
+    async def audio():
+        try:
+            async for chunk in stream_speech(
+                sentences, partial(speech.synthesize, voice=voice, speed=1.0, response_format=response_format),
+                TTS_MAX_PARALLEL,
+            ):
+                yield chunk
+        except Exception as e:
+            # Headers are already sent; the client sees a truncated stream
+            logger.error(f"Error in text_to_audio_stream: {str(e)}")
+
+    return StreamingResponse(audio(), media_type=SPEECH_MEDIA_TYPES[response_format])
+
+def check_audio_upload(file: UploadFile):
+    extension = Path(file.filename or "").suffix.lower().lstrip(".")
+    if extension not in TRANSCRIPTION_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Audio format must be one of {list(TRANSCRIPTION_FORMATS)}")
+    if file.size is not None and file.size > TRANSCRIPTION_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Audio file exceeds the 25 MB limit")
+
 @app.post("/audio-to-text")
 async def audio_to_text(
     file: UploadFile = File(...),
     prompt: Optional[str] = Form("")
 ):
-    """Convert audio to text using OpenAI's Whisper API."""
+    """Convert audio to text using OpenAI's Whisper API.
+
+    The upload is passed to the API straight from the request's spooled
+    buffer (in memory below ``UPLOAD_SPOOL_MAX_BYTES``), never copied to disk.
+    """
     try:
-        if not file.filename.endswith('.mp3'):
-            raise HTTPException(status_code=400, detail="File must be MP3 format")
-        
+        check_audio_upload(file)
         logger.info(f"Processing audio file: {file.filename}")
-        temp_path = TEMP_DIR / "temp_audio.mp3"
-        
-        with temp_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        transcription_options = {
-            "model": "whisper-1",
-            "file": open(temp_path, "rb"),
-            "language": "pt",
-            "response_format": "text"
-        }
-        
         if prompt:
-            transcription_options["prompt"] = prompt
             logger.info(f"Using prompt: {prompt}")
-        
-        transcription = client.audio.transcriptions.create(**transcription_options)
-        
-        # Clean up temporary file
-        temp_path.unlink()
+
+        transcription = await providers.transcribe(file.file, file.filename, prompt=prompt)
         logger.info("Audio transcription completed successfully")
-        
+
         return {"transcription": transcription}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in audio_to_text: {str(e)}")
-        # Ensure cleanup on error
-        if temp_path.exists():
-            temp_path.unlink()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await file.close()
+
+@app.websocket("/ws/audio-to-text")
+async def audio_to_text_stream(websocket: WebSocket, sample_rate: int = 16000, prompt: str = ""):
+    """Transcribe live microphone audio.
+
+    The client sends binary messages of 16-bit little-endian mono PCM at
+    ``sample_rate`` and a text message ``{"type": "end"}`` when it stops.
+    An energy VAD cuts the stream into utterances, which are transcribed
+    concurrently. The server replies with JSON messages: ``speech_start``,
+    ``partial`` (running transcript of a long utterance), ``final`` per
+    utterance, ``error``, and ``done`` once everything is transcribed.
+    """
+    await websocket.accept()
+    if not 8000 <= sample_rate <= 48000:
+        await websocket.send_json({"type": "error", "detail": "sample_rate must be between 8000 and 48000"})
+        await websocket.close(code=1003)
+        return
+
+    vad = EnergyVAD(sample_rate)
+    outbox: asyncio.Queue = asyncio.Queue()
+    finals = {}
+    partials_in_flight = set()
+    tasks = set()
+
+    async def transcribe(event, kind):
+        try:
+            # Whisper keeps names and spelling consistent when given the preceding text
+            previous = " ".join(finals[segment] for segment in sorted(finals) if segment < event.segment)
+            context = f"{prompt} {previous[-400:]}".strip()
+            text = await providers.transcribe(
+                pcm_to_wav(event.pcm, sample_rate), f"segment-{event.segment}.wav", prompt=context
+            )
+            text = text.strip()
+            if kind == "final":
+                finals[event.segment] = text
+            elif event.segment in finals:
+                return
+            await outbox.put({"type": kind, "segment": event.segment, "text": text,
+                              "start": round(event.start, 2), "end": round(event.end, 2)})
+        except Exception as e:
+            logger.error(f"Error in audio_to_text_stream: {str(e)}")
+            await outbox.put({"type": "error", "segment": event.segment, "detail": str(e)})
+        finally:
+            if kind == "partial":
+                partials_in_flight.discard(event.segment)
+
+    def launch(event, kind):
+        task = asyncio.create_task(transcribe(event, kind))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def handle(events):
+        for event in events:
+            if event.kind == SPEECH_START:
+                outbox.put_nowait({"type": "speech_start", "segment": event.segment,
+                                   "start": round(event.start, 2)})
+            elif event.kind == SPEECH_CONTINUE and event.segment not in partials_in_flight:
+                partials_in_flight.add(event.segment)
+                launch(event, "partial")
+            elif event.kind == UTTERANCE:
+                launch(event, "final")
+
+    async def send_messages():
+        # A single writer, so concurrent transcriptions never interleave sends
+        while (message := await outbox.get()) is not None:
+            await websocket.send_json(message)
+
+    sender = asyncio.create_task(send_messages())
+    finished = False
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                handle(vad.feed(message["bytes"]))
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    control = None
+                if not isinstance(control, dict):
+                    # Reported, but the audio stream carries on
+                    outbox.put_nowait({"type": "error", "detail": "Text messages must be JSON objects"})
+                elif control.get("type") == "end":
+                    handle(vad.flush())
+                    finished = True
+                    break
+
+        if finished:
+            await asyncio.gather(*tasks)
+            await outbox.put({"type": "done", "segments": len(finals)})
+            await outbox.put(None)
+            await sender
+            await websocket.close()
+    except Exception as e:
+        logger.error(f"Error in audio_to_text_stream: {str(e)}")
+    finally:
+        for task in [*tasks, sender]:
+            task.cancel()
+
+def elapsed_ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 1)
+
+@app.post("/voice-query")
+async def voice_query(
+    file: UploadFile = File(...),
+    prompt: Optional[str] = Form(""),
+    voice: Optional[str] = Form("alloy"),
+    response_format: str = Form("mp3"),
+    use_cache: bool = Form(True),
+    collection: str = Form(DEFAULT_COLLECTION),
+):
+    """Answer a spoken question with a spoken answer in one round trip.
+
+    The audio is transcribed, the documents searched, and LLM tokens are
+    cut into sentences that are synthesized while the answer is still being
+    generated. The response is a Server-Sent Events stream: ``transcript``,
+    ``sources``, ``token`` (answer text), ``audio`` (base64 audio per
+    sentence, in order), ``timings`` (per-stage milliseconds) and ``done``,
+    or ``error``.
+    """
+    check_collection(collection)
+    if response_format not in STREAMABLE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"response_format must be one of {list(STREAMABLE_FORMATS)}")
+    started = time.perf_counter()
+    timings = {}
+    try:
+        check_audio_upload(file)
+        stage = time.perf_counter()
+        question = (await providers.transcribe(file.file, file.filename, prompt=prompt)).strip()
+        timings["transcription_ms"] = elapsed_ms(stage)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in voice_query: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await file.close()
+    if not question:
+        raise HTTPException(status_code=400, detail="No speech detected in the audio")
+    logger.info(f"Voice query: {question}")
+
+    query = Query(question=question, collection=collection, use_cache=use_cache)
+    stage = time.perf_counter()
+    context, cached = await prepare_query(query)
+    timings["embedding_ms"] = elapsed_ms(stage)
+    if cached is None:
+        stage = time.perf_counter()
+        hits = await retrieve_for(context)
+        timings["retrieval_ms"] = elapsed_ms(stage)
+        sources = source_metadata(hits)
+        prompt_context = build_context(hits)
+    else:
+        sources = cached["sources"]
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+               "X-Cache": "HIT" if cached is not None else "MISS"}
+
+    async def answer_tokens():
+        if cached is not None:
+            yield cached["response"]
+            return
+        inputs = answer_inputs(prompt_context, question)
+        async for token in providers.stream("chat", lambda: answer_chain().astream(inputs)):
+            yield token
+
+    async def events():
+        outbox: asyncio.Queue = asyncio.Queue()
+        sentences: asyncio.Queue = asyncio.Queue()
+        answer = []
+
+        async def generate():
+            stage = time.perf_counter()
+            buffer = SentenceBuffer()
+            try:
+                async for token in answer_tokens():
+                    if not token:
+                        continue
+                    if not answer:
+                        timings["llm_first_token_ms"] = elapsed_ms(stage)
+                    answer.append(token)
+                    outbox.put_nowait(sse_event("token", {"token": token}))
+                    for sentence in buffer.feed(token):
+                        sentences.put_nowait(sentence)
+                for sentence in buffer.flush():
+                    sentences.put_nowait(sentence)
+                timings["llm_ms"] = elapsed_ms(stage)
+            finally:
+                sentences.put_nowait(None)
+
+        async def queued_sentences():
+            while (sentence := await sentences.get()) is not None:
+                yield sentence
+
+        async def speak():
+            synthesize = partial(speech.synthesize, voice=voice, speed=1.0, response_format=response_format)
+            index = 0
+            async for audio in stream_speech(queued_sentences(), synthesize, TTS_MAX_PARALLEL):
+                if index == 0:
+                    timings["first_audio_ms"] = elapsed_ms(started)
+                outbox.put_nowait(sse_event("audio", {
+                    "index": index,
+                    "format": response_format,
+                    "audio": base64.b64encode(audio).decode("ascii"),
+                }))
+                index += 1
+
+        yield sse_event("transcript", {"text": question})
+        yield sse_event("sources", sources)
+        tasks = [asyncio.create_task(generate()), asyncio.create_task(speak())]
+        stage = time.perf_counter()
+        try:
+            pipeline = asyncio.gather(*tasks)
+            pipeline.add_done_callback(lambda _: outbox.put_nowait(None))
+            while (event := await outbox.get()) is not None:
+                yield event
+            await pipeline
+            timings["pipeline_ms"] = elapsed_ms(stage)
+            timings["total_ms"] = elapsed_ms(started)
+            response = "".join(answer)
+            if cached is None:
+                TOKENS.inc(estimate_tokens(response), kind="completion")
+                remember_answer(query, context, response, sources, context_stats(prompt_context))
+            logger.info(f"Voice query timings: {timings}")
+            yield sse_event("timings", timings)
+            yield sse_event("done", {"question": question, "response": response})
+        except Exception as e:
+            logger.error(f"Error in voice_query: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
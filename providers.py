@@ -0,0 +1,254 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable, List, Optional, TypeVar, Union
+
+import httpx
+from langchain_core.embeddings import Embeddings
+
+from embedding_scheduler import estimate_tokens
+from metrics import PROVIDER_RETRIES, STAGE_SECONDS, TOKENS, timed
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def retryable_errors(rate_limits: bool = True) -> tuple:
+    """Connection problems, timeouts, 429 and 5xx are worth another attempt.
+
+    The OpenAI SDK is slow to import, so it is only loaded once needed.
+    """
+    import openai
+    errors = (openai.APIConnectionError, openai.InternalServerError)
+    return errors + (openai.RateLimitError,) if rate_limits else errors
+
+
+# Pipeline stage each provider's calls are timed under
+PROVIDER_STAGES = {
+    "embeddings": "embed",
+    "chat": "llm",
+    "tts": "tts",
+    "transcription": "whisper",
+}
+
+
+@dataclass(frozen=True)
+class ProviderSettings:
+    timeout: float = 60.0
+    connect_timeout: float = 5.0
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    max_retries: int = 3
+    base_backoff: float = 0.5
+    max_backoff: float = 8.0
+    embeddings_concurrency: int = 8
+    chat_concurrency: int = 16
+    tts_concurrency: int = 8
+    transcription_concurrency: int = 4
+
+    @classmethod
+    def from_env(cls) -> "ProviderSettings":
+        return cls(
+            timeout=float(os.getenv("PROVIDER_TIMEOUT", cls.timeout)),
+            max_connections=int(os.getenv("PROVIDER_MAX_CONNECTIONS", cls.max_connections)),
+            max_keepalive_connections=int(os.getenv("PROVIDER_MAX_KEEPALIVE", cls.max_keepalive_connections)),
+            max_retries=int(os.getenv("PROVIDER_MAX_RETRIES", cls.max_retries)),
+            embeddings_concurrency=int(os.getenv("EMBEDDINGS_CONCURRENCY", cls.embeddings_concurrency)),
+            chat_concurrency=int(os.getenv("CHAT_CONCURRENCY", cls.chat_concurrency)),
+            tts_concurrency=int(os.getenv("TTS_CONCURRENCY", cls.tts_concurrency)),
+            transcription_concurrency=int(os.getenv("TRANSCRIPTION_CONCURRENCY", cls.transcription_concurrency)),
+        )
+
+
+class Providers:
+    """Non-blocking access to embeddings, chat, TTS and transcription.
+
+    Every call shares one pooled keep-alive HTTP client, runs under a
+    per-provider concurrency limit and is retried with full-jitter
+    exponential backoff. Point ``OPENAI_BASE_URL`` at a local fake server
+    (``benchmarks/fake_openai_server.py``) to load-test offline.
+
+    The clients are created on first use (or by ``connect``), so neither
+    the SDK import nor a missing API key holds up process start.
+    """
+
+    def __init__(self, settings: Optional[ProviderSettings] = None):
+        self.settings = settings or ProviderSettings()
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._client = None
+        self._lock = threading.Lock()
+        self.limits = {
+            "embeddings": asyncio.Semaphore(self.settings.embeddings_concurrency),
+            "chat": asyncio.Semaphore(self.settings.chat_concurrency),
+            "tts": asyncio.Semaphore(self.settings.tts_concurrency),
+            "transcription": asyncio.Semaphore(self.settings.transcription_concurrency),
+        }
+
+    def _create_clients(self):
+        import openai
+
+        timeout = openai.Timeout(self.settings.timeout, connect=self.settings.connect_timeout)
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=self.settings.max_connections,
+                max_keepalive_connections=self.settings.max_keepalive_connections,
+                keepalive_expiry=self.settings.keepalive_expiry,
+            ),
+            timeout=timeout,
+        )
+        # Retries happen here, with jitter, rather than inside the SDK
+        self._client = openai.AsyncOpenAI(http_client=http_client, max_retries=0, timeout=timeout)
+        self._http_client = http_client
+
+    def _ensure_clients(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._create_clients()
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """The pooled HTTP client, shared with the LangChain clients."""
+        self._ensure_clients()
+        return self._http_client
+
+    @property
+    def client(self):
+        """The ``openai.AsyncOpenAI`` client."""
+        self._ensure_clients()
+        return self._client
+
+    async def connect(self):
+        """Create the clients and open a pooled connection with a cheap request."""
+        await asyncio.to_thread(self._ensure_clients)
+        await self._client.models.list()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.settings.max_backoff, self.settings.base_backoff * 2 ** attempt))
+
+    async def call(self, provider: str, request: Callable[[], Awaitable[T]], retry_rate_limits: bool = True) -> T:
+        """Run ``request()`` under the provider's limit, retrying transient failures.
+
+        With ``retry_rate_limits=False`` a 429 is raised at once, for callers
+        that pace themselves (``EmbeddingScheduler``).
+        """
+        with timed(PROVIDER_STAGES[provider]):
+            async with self.limits[provider]:
+                for attempt in range(self.settings.max_retries + 1):
+                    try:
+                        return await request()
+                    except retryable_errors(retry_rate_limits) as e:
+                        if attempt == self.settings.max_retries:
+                            raise
+                        PROVIDER_RETRIES.inc(provider=provider)
+                        delay = self._backoff(attempt)
+                        logger.warning(f"{provider} call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                        await asyncio.sleep(delay)
+
+    async def stream(self, provider: str, request: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Like ``call`` for streams; retries only until the first item arrives.
+
+        Besides the total, the time to the first non-empty item is recorded
+        as the ``<stage>_first_token`` stage.
+        """
+        stage = PROVIDER_STAGES[provider]
+        start = time.perf_counter()
+        first = True
+        with timed(stage):
+            async with self.limits[provider]:
+                for attempt in range(self.settings.max_retries + 1):
+                    started = False
+                    try:
+                        async for item in request():
+                            started = True
+                            if first and item:
+                                STAGE_SECONDS.observe(time.perf_counter() - start, stage=f"{stage}_first_token")
+                                first = False
+                            yield item
+                        return
+                    except retryable_errors() as e:
+                        if started or attempt == self.settings.max_retries:
+                            raise
+                        PROVIDER_RETRIES.inc(provider=provider)
+                        delay = self._backoff(attempt)
+                        logger.warning(f"{provider} stream failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                        await asyncio.sleep(delay)
+
+    async def synthesize(self, text: str, voice: str = "alloy", speed: float = 1.0,
+                         response_format: str = "mp3", model: str = "tts-1") -> bytes:
+        async def request():
+            response = await self.client.audio.speech.create(
+                model=model, voice=voice, input=text, speed=speed, response_format=response_format,
+            )
+            return response.content
+        return await self.call("tts", request)
+
+    async def transcribe(self, audio: Union[bytes, BinaryIO], filename: str, prompt: str = "",
+                         language: str = "pt", model: str = "whisper-1") -> str:
+        """Transcribe audio given as bytes or a seekable file object (streamed, not copied)."""
+        options = {
+            "model": model,
+            "file": (filename, audio),
+            "language": language,
+            "response_format": "text",
+        }
+        if prompt:
+            options["prompt"] = prompt
+
+        async def request():
+            if hasattr(audio, "seek"):
+                audio.seek(0)
+            return await self.client.audio.transcriptions.create(**options)
+        return await self.call("transcription", request)
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+
+
+class ProviderEmbeddings(Embeddings):
+    """Route an Embeddings implementation's async calls through the provider limits.
+
+    ``underlying`` may be a factory, called on first use; ``model`` then
+    names it without building it. With ``retry_rate_limits=False``,
+    document batches raise 429s straight away, so the ``EmbeddingScheduler``
+    running them can back off, cut concurrency and honour ``Retry-After``.
+    """
+
+    def __init__(self, providers: Providers, underlying: Union[Embeddings, Callable[[], Embeddings]],
+                 model: Optional[str] = None, retry_rate_limits: bool = True):
+        self.providers = providers
+        self.retry_rate_limits = retry_rate_limits
+        self._underlying = underlying if isinstance(underlying, Embeddings) else None
+        self._factory = underlying if self._underlying is None else None
+        self._lock = threading.Lock()
+        self.model = model or getattr(underlying, "model", type(underlying).__name__)
+
+    @property
+    def underlying(self) -> Embeddings:
+        if self._underlying is None:
+            with self._lock:
+                if self._underlying is None:
+                    self._underlying = self._factory()
+        return self._underlying
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        TOKENS.inc(sum(estimate_tokens(text) for text in texts), kind="embedding")
+        return await self.providers.call("embeddings", lambda: self.underlying.aembed_documents(texts),
+                                         retry_rate_limits=self.retry_rate_limits)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        TOKENS.inc(estimate_tokens(text), kind="embedding")
+        return await self.providers.call("embeddings", lambda: self.underlying.aembed_query(text))
@@ -0,0 +1,185 @@
+import os
+import logging
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+from ann_index import iter_vectors
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RetrievalSettings:
+    """Knobs for a single retrieval call."""
+    k: int = 4
+    fetch_k: int = 20
+    use_mmr: bool = False
+    lambda_mult: float = 0.5
+    # Minimum relevance in [0, 1]; None keeps every hit.
+    score_threshold: Optional[float] = None
+    # Hybrid fusion of vector and BM25 results; a zero lexical weight means vector-only.
+    # "rrf" fuses ranks, "linear" fuses scores (vector relevance, BM25 / best BM25).
+    fusion: str = "rrf"
+    vector_weight: float = 1.0
+    lexical_weight: float = 1.0
+    rrf_k: int = 60
+
+    def __post_init__(self):
+        if self.k < 1:
+            raise ValueError("k must be at least 1")
+        if self.fetch_k < self.k:
+            raise ValueError("fetch_k must be at least k")
+        if not 0 <= self.lambda_mult <= 1:
+            raise ValueError("lambda_mult must be between 0 and 1")
+        if self.score_threshold is not None and not 0 <= self.score_threshold <= 1:
+            raise ValueError("score_threshold must be between 0 and 1")
+        if self.fusion not in ("rrf", "linear"):
+            raise ValueError(f"Unknown fusion {self.fusion!r}")
+        if self.vector_weight < 0 or self.lexical_weight < 0:
+            raise ValueError("vector_weight and lexical_weight must not be negative")
+        if self.vector_weight + self.lexical_weight <= 0:
+            raise ValueError("vector_weight and lexical_weight must not both be 0")
+
+    @classmethod
+    def from_env(cls) -> "RetrievalSettings":
+        threshold = os.getenv("RETRIEVAL_SCORE_THRESHOLD")
+        return cls(
+            k=int(os.getenv("RETRIEVAL_K", cls.k)),
+            fetch_k=int(os.getenv("RETRIEVAL_FETCH_K", cls.fetch_k)),
+            use_mmr=os.getenv("RETRIEVAL_USE_MMR", "false").lower() == "true",
+            lambda_mult=float(os.getenv("RETRIEVAL_LAMBDA_MULT", cls.lambda_mult)),
+            score_threshold=float(threshold) if threshold else None,
+            fusion=os.getenv("RETRIEVAL_FUSION", cls.fusion),
+            vector_weight=float(os.getenv("RETRIEVAL_VECTOR_WEIGHT", cls.vector_weight)),
+            lexical_weight=float(os.getenv("RETRIEVAL_LEXICAL_WEIGHT", cls.lexical_weight)),
+            rrf_k=int(os.getenv("RETRIEVAL_RRF_K", cls.rrf_k)),
+        )
+
+    def override(self, **overrides) -> "RetrievalSettings":
+        """Return a copy with the non-None overrides applied."""
+        values = {key: value for key, value in overrides.items() if value is not None}
+        values["fetch_k"] = max(values.get("fetch_k", self.fetch_k), values.get("k", self.k))
+        return replace(self, **values)
+
+
+class Retriever:
+    """Search the loaded FAISS index without re-embedding stored chunks.
+
+    The question is embedded once; candidates, MMR diversity and relevance
+    scores are all computed from the vectors already held by the index.
+    Many questions can be searched together in a single FAISS call.
+    When a BM25 index is given, its results are fused with the vector
+    results (weighted reciprocal rank fusion, or a weighted sum of scores),
+    so exact terms such as article numbers and product codes are not lost.
+    """
+
+    def __init__(self, settings: RetrievalSettings):
+        self.settings = settings
+
+    def retrieve(self, vectorstore, question: str, settings: Optional[RetrievalSettings] = None,
+                 lexical=None) -> List[Tuple[Document, float]]:
+        """Return (document, relevance) pairs for the question, best first."""
+        settings = settings or self.settings
+        query_vector = vectorstore.embeddings.embed_query(question)
+        return self.retrieve_by_vector(vectorstore, query_vector, settings, lexical, question)
+
+    def retrieve_by_vector(self, vectorstore, query_vector: List[float],
+                           settings: Optional[RetrievalSettings] = None, lexical=None,
+                           question: Optional[str] = None) -> List[Tuple[Document, float]]:
+        return self.retrieve_by_vectors(vectorstore, [query_vector], settings, lexical,
+                                        [question] if question is not None else None)[0]
+
+    def retrieve_by_vectors(self, vectorstore, query_vectors: Sequence[List[float]],
+                            settings: Optional[RetrievalSettings] = None, lexical=None,
+                            questions: Optional[Sequence[str]] = None) -> List[List[Tuple[Document, float]]]:
+        """``retrieve_by_vector`` for many questions, with one matrix search for all of them."""
+        settings = settings or self.settings
+        hybrid = lexical is not None and questions is not None and settings.lexical_weight > 0
+        # MMR picks from a deeper candidate list, and fusion needs one too
+        depth = settings.fetch_k if hybrid or settings.use_mmr else settings.k
+        vectors = np.array(query_vectors, dtype=np.float32)
+        if vectorstore._normalize_L2:
+            faiss.normalize_L2(vectors)
+        distances, positions = vectorstore.index.search(vectors, depth)
+
+        batch = []
+        for i, vector in enumerate(vectors):
+            results = self._vector_hits(vectorstore, vector, distances[i], positions[i], settings)
+            if hybrid:
+                lexical_hits = self._lexical_hits(lexical.search(questions[i], settings.fetch_k), settings)
+                results = self._fuse(vectorstore, results, lexical_hits, settings)
+            batch.append(results)
+        logger.info(f"Retrieved chunks for {len(batch)} question(s) "
+                    f"(k={settings.k}, mmr={settings.use_mmr}, hybrid={hybrid})")
+        return batch
+
+    @staticmethod
+    def _vector_hits(vectorstore, query_vector: np.ndarray, distances: np.ndarray, positions: np.ndarray,
+                     settings: RetrievalSettings) -> List[Tuple[Document, float]]:
+        """Turn one row of search results into (document, relevance) pairs."""
+        # -1 pads the results when the index holds fewer vectors than asked for
+        found = positions >= 0
+        positions, distances = positions[found], distances[found]
+        if settings.use_mmr and len(positions):
+            candidates = np.concatenate(list(iter_vectors(vectorstore.index, positions)))
+            selected = maximal_marginal_relevance(
+                query_vector[None, :], candidates, k=settings.k, lambda_mult=settings.lambda_mult,
+            )
+            positions, distances = positions[selected], distances[selected]
+
+        relevance_fn = vectorstore._select_relevance_score_fn()
+        results = [
+            (vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(position)]),
+             float(relevance_fn(distance)))
+            for position, distance in zip(positions, distances)
+        ]
+        if settings.score_threshold is not None:
+            results = [
+                (doc, relevance) for doc, relevance in results
+                if relevance >= settings.score_threshold
+            ]
+        return results
+
+    @staticmethod
+    def _lexical_hits(lexical_hits: List[Tuple[str, float]],
+                      settings: RetrievalSettings) -> List[Tuple[str, float]]:
+        """Apply the score threshold to BM25 hits, with scores relative to the best one."""
+        if settings.score_threshold is None or not lexical_hits:
+            return lexical_hits
+        top = lexical_hits[0][1]
+        return [(chunk_id, score) for chunk_id, score in lexical_hits
+                if top > 0 and score / top >= settings.score_threshold]
+
+    @staticmethod
+    def _fuse(vectorstore, vector_hits: List[Tuple[Document, float]], lexical_hits: List[Tuple[str, float]],
+              settings: RetrievalSettings) -> List[Tuple[Document, float]]:
+        """Combine both result lists; fused scores are scaled so a chunk best in both is 1.0."""
+        linear = settings.fusion == "linear"
+        top_lexical = lexical_hits[0][1] if lexical_hits else 1.0
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Document] = {}
+        for rank, (doc, relevance) in enumerate(vector_hits, start=1):
+            weight = min(max(relevance, 0.0), 1.0) if linear else 1 / (settings.rrf_k + rank)
+            scores[doc.id] = scores.get(doc.id, 0.0) + settings.vector_weight * weight
+            docs[doc.id] = doc
+        for rank, (chunk_id, score) in enumerate(lexical_hits, start=1):
+            if chunk_id not in docs:
+                doc = vectorstore.docstore.search(chunk_id)
+                if not isinstance(doc, Document):
+                    continue
+                docs[chunk_id] = doc
+            weight = score / top_lexical if linear else 1 / (settings.rrf_k + rank)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + settings.lexical_weight * weight
+
+        best = settings.vector_weight + settings.lexical_weight
+        if best <= 0:
+            return []
+        if not linear:
+            best /= settings.rrf_k + 1
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:settings.k]
+        return [(docs[chunk_id], score / best) for chunk_id, score in ranked]
@@ -0,0 +1,122 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """Answers to past questions, looked up by question-embedding similarity.
+
+    Question vectors are L2-normalized in an inner-product FAISS index, so
+    scores are cosine similarities. Entries are tied to the document index
+    version they were answered from and dropped when a newer one is seen;
+    requests still on an older version neither hit nor store. Entries also
+    expire after ``ttl`` seconds, and the oldest go first past ``max_entries``.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index_version = None
+        self._index = None
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._next_id = 0
+
+    def _reset(self, index_version: int):
+        self._index_version = index_version
+        self._index = None
+        self._entries.clear()
+
+    def _current(self, index_version: int) -> bool:
+        """Move to ``index_version`` if it is newer; False if it is older than the cache."""
+        if self._index_version is None or index_version > self._index_version:
+            self._reset(index_version)
+        return index_version == self._index_version
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray([vector], dtype=np.float32)
+        faiss.normalize_L2(array)
+        return array
+
+    def _remove(self, ids: List[int]):
+        if ids:
+            self._index.remove_ids(np.asarray(ids, dtype=np.int64))
+            for entry_id in ids:
+                self._entries.pop(entry_id, None)
+
+    def lookup(self, vector: List[float], index_version: int, signature: str) -> Optional[dict]:
+        """Return the cached {question, response, sources, context} for a similar question."""
+        with self._lock:
+            if not self._current(index_version) or self._index is None or not self._entries:
+                self.misses += 1
+                return None
+
+            scores, ids = self._index.search(self._normalize(vector), min(4, len(self._entries)))
+            now = time.time()
+            expired = []
+            found = None
+            for score, entry_id in zip(scores[0], ids[0]):
+                entry = self._entries.get(int(entry_id))
+                if entry is None or score < self.threshold:
+                    continue
+                if now - entry["created_at"] > self.ttl:
+                    expired.append(int(entry_id))
+                    continue
+                if entry["signature"] == signature:
+                    found = dict(entry, similarity=float(score))
+                    break
+            self._remove(expired)
+
+            if found is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return found
+
+    def store(self, vector: List[float], index_version: int, signature: str,
+              question: str, response: str, sources: List[dict], context: Optional[dict] = None):
+        with self._lock:
+            # Answered from an index that has since been replaced
+            if not self._current(index_version):
+                return
+            normalized = self._normalize(vector)
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(normalized.shape[1]))
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(normalized, np.asarray([entry_id], dtype=np.int64))
+            self._entries[entry_id] = {
+                "question": question,
+                "response": response,
+                "sources": sources,
+                "context": context,
+                "signature": signature,
+                "created_at": time.time(),
+            }
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._remove(list(self._entries)[:overflow])
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "index_version": self._index_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
@@ -0,0 +1,165 @@
+import re
+import asyncio
+import logging
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, List, Union
+
+logger = logging.getLogger(__name__)
+
+# End of sentence: terminal punctuation, optional closing quotes/brackets, whitespace
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])["\'»”)\]]*\s+')
+CLAUSE_BOUNDARY = re.compile(r'(?<=[,;:])\s+')
+
+# Output formats offered by the TTS API and the content types they are served as
+SPEECH_MEDIA_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+    "pcm": "audio/L16;rate=24000;channels=1",
+}
+# Formats whose per-sentence outputs can simply be concatenated into one stream
+STREAMABLE_FORMATS = ("mp3", "aac", "opus", "pcm")
+
+
+class OpenAISpeech:
+    """Text-to-speech through the shared async provider layer."""
+
+    def __init__(self, providers, model: str = "tts-1"):
+        self.providers = providers
+        self.model = model
+
+    async def synthesize(self, text: str, voice: str = "alloy", speed: float = 1.0,
+                         response_format: str = "mp3") -> bytes:
+        return await self.providers.synthesize(
+            text, voice=voice, speed=speed, response_format=response_format, model=self.model
+        )
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    """Break an overlong sentence at clause boundaries, then at spaces."""
+    parts, current = [], ""
+    for clause in CLAUSE_BOUNDARY.split(sentence):
+        while len(clause) > max_chars:
+            cut = clause.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(clause[:cut].strip())
+            clause = clause[cut:].strip()
+        if current and len(current) + 1 + len(clause) > max_chars:
+            parts.append(current)
+            current = clause
+        else:
+            current = f"{current} {clause}" if current else clause
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_sentences(text: str, min_chars: int = 20, max_chars: int = 400) -> List[str]:
+    """Split text into sentences sized for speech synthesis.
+
+    Fragments shorter than ``min_chars`` are merged into the next sentence
+    so synthesis requests are not wasted on "Sim." or list markers.
+    """
+    sentences: List[str] = []
+    pending = ""
+    for sentence in SENTENCE_BOUNDARY.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        pending = f"{pending} {sentence}" if pending else sentence
+        if len(pending) >= min_chars:
+            sentences.extend(_split_long(pending, max_chars))
+            pending = ""
+    if pending:
+        if sentences and len(sentences[-1]) + 1 + len(pending) <= max_chars:
+            sentences[-1] = f"{sentences[-1]} {pending}"
+        else:
+            sentences.append(pending)
+    return sentences
+
+
+class SentenceBuffer:
+    """Turn a stream of LLM tokens into sentences ready for synthesis.
+
+    Applies the same merging and length limits as ``split_sentences``; a
+    sentence is released once the whitespace after its final punctuation
+    arrives, and ``flush`` returns whatever is left at the end.
+    """
+
+    def __init__(self, min_chars: int = 20, max_chars: int = 400):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._text = ""
+        self._pending = ""
+
+    def feed(self, token: str) -> List[str]:
+        self._text += token
+        *complete, self._text = SENTENCE_BOUNDARY.split(self._text)
+        if len(self._text) > self.max_chars:
+            # No sentence end in sight; release whole clauses so speech keeps up
+            *long_parts, self._text = _split_long(self._text, self.max_chars)
+            complete.extend(long_parts)
+        ready = []
+        for sentence in complete:
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            self._pending = f"{self._pending} {sentence}" if self._pending else sentence
+            if len(self._pending) >= self.min_chars:
+                ready.extend(_split_long(self._pending, self.max_chars))
+                self._pending = ""
+        return ready
+
+    def flush(self) -> List[str]:
+        rest = f"{self._pending} {self._text.strip()}".strip()
+        self._text = self._pending = ""
+        return _split_long(rest, self.max_chars) if rest else []
+
+
+async def stream_speech(sentences: Union[Iterable[str], AsyncIterable[str]],
+                        synthesize: Callable[[str], Awaitable[bytes]],
+                        max_parallel: int = 3) -> AsyncIterator[bytes]:
+    """Synthesize sentences concurrently and yield their audio in order.
+
+    Up to ``max_parallel`` sentences are in flight ahead of the one being
+    sent, so the first audio goes out as soon as the first sentence is done.
+    ``sentences`` may be an async iterable that is still being produced,
+    e.g. by an LLM stream.
+    """
+    slots = asyncio.Semaphore(max_parallel)
+    launched: asyncio.Queue = asyncio.Queue()
+
+    async def source():
+        if hasattr(sentences, "__aiter__"):
+            async for sentence in sentences:
+                yield sentence
+        else:
+            for sentence in sentences:
+                yield sentence
+
+    async def launch():
+        try:
+            async for sentence in source():
+                await slots.acquire()
+                launched.put_nowait(asyncio.ensure_future(synthesize(sentence)))
+        finally:
+            launched.put_nowait(None)
+
+    feeder = asyncio.ensure_future(launch())
+    try:
+        while (task := await launched.get()) is not None:
+            audio = await task
+            slots.release()
+            yield audio
+        # Surface errors from the sentence source
+        await feeder
+    finally:
+        feeder.cancel()
+        while not launched.empty():
+            task = launched.get_nowait()
+            if task is not None:
+                task.cancel()
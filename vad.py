@@ -0,0 +1,126 @@
+import io
+import wave
+import math
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+# Events produced by EnergyVAD.feed
+SPEECH_START = "speech_start"
+SPEECH_CONTINUE = "speech_continue"
+UTTERANCE = "utterance"
+
+
+@dataclass
+class VADEvent:
+    kind: str
+    segment: int
+    start: float
+    end: float
+    pcm: bytes = b""
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """Wrap 16-bit mono PCM in a WAV container, in memory."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class EnergyVAD:
+    """Energy-based voice activity detection over 16-bit mono PCM.
+
+    Audio is cut into ``frame_ms`` frames and a frame counts as speech when
+    its RMS level is ``margin_db`` above an adaptive noise floor. An utterance
+    starts after ``min_speech_ms`` of speech and ends after ``silence_ms`` of
+    silence (or at ``max_utterance_s``); ``pre_roll_ms`` of audio before the
+    start is kept so the first syllable is not clipped.
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 30, margin_db: float = 12.0,
+                 min_level_db: float = -50.0, min_speech_ms: int = 150, silence_ms: int = 600,
+                 pre_roll_ms: int = 300, max_utterance_s: float = 20.0, partial_every_s: float = 2.0):
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.frame_seconds = frame_ms / 1000
+        self.margin_db = margin_db
+        self.min_level_db = min_level_db
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.pre_roll_frames = pre_roll_ms // frame_ms
+        self.max_frames = int(max_utterance_s * 1000) // frame_ms
+        self.partial_frames = int(partial_every_s * 1000) // frame_ms if partial_every_s else 0
+        # Seeded at the quietest level that can count as speech, not from the
+        # first frame, which may already be speech
+        self.noise_floor_db = min_level_db
+        self.segment = 0
+        self._pending = bytearray()
+        self._frames: List[bytes] = []
+        self._in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self._position = 0
+
+    def _level_db(self, frame: bytes) -> float:
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        rms = math.sqrt(float(np.mean(samples * samples))) / 32768.0
+        return 20 * math.log10(max(rms, 1e-9))
+
+    def _is_speech(self, level: float) -> bool:
+        speech = level > max(self.noise_floor_db + self.margin_db, self.min_level_db)
+        if not speech:
+            # Track the background level only while nobody is talking
+            self.noise_floor_db = 0.95 * self.noise_floor_db + 0.05 * level
+        return speech
+
+    def _event(self, kind: str, pcm: bytes = b"", trailing: int = 0) -> VADEvent:
+        start = (self._position - len(self._frames)) * self.frame_seconds
+        end = (self._position - trailing) * self.frame_seconds
+        return VADEvent(kind, self.segment, start, end, pcm)
+
+    def _finish(self) -> VADEvent:
+        # Drop the trailing silence that closed the utterance
+        trailing = self._silence_run if self._silence_run < len(self._frames) else 0
+        event = self._event(UTTERANCE, b"".join(self._frames[:len(self._frames) - trailing]), trailing)
+        self.segment += 1
+        self._frames = []
+        self._in_speech = False
+        self._speech_run = self._silence_run = 0
+        return event
+
+    def feed(self, pcm: bytes) -> List[VADEvent]:
+        """Consume PCM bytes and return any events they complete."""
+        self._pending.extend(pcm)
+        events = []
+        while len(self._pending) >= self.frame_bytes:
+            frame = bytes(self._pending[:self.frame_bytes])
+            del self._pending[:self.frame_bytes]
+            self._position += 1
+            speech = self._is_speech(self._level_db(frame))
+            self._frames.append(frame)
+
+            if not self._in_speech:
+                self._speech_run = self._speech_run + 1 if speech else 0
+                if self._speech_run >= self.min_speech_frames:
+                    self._in_speech = True
+                    self._silence_run = 0
+                    events.append(self._event(SPEECH_START))
+                elif len(self._frames) > self.pre_roll_frames + self._speech_run:
+                    del self._frames[0]
+                continue
+
+            self._silence_run = 0 if speech else self._silence_run + 1
+            if self._silence_run >= self.silence_frames or len(self._frames) >= self.max_frames:
+                events.append(self._finish())
+            elif self.partial_frames and len(self._frames) % self.partial_frames == 0:
+                events.append(self._event(SPEECH_CONTINUE, b"".join(self._frames)))
+        return events
+
+    def flush(self) -> List[VADEvent]:
+        """End of stream: close any utterance in progress."""
+        return [self._finish()] if self._in_speech else []